@@ -29,63 +29,63 @@ def make_inet_project_description(inet_version, omnetpp_versions):
             "ffmpeg-headless" if inet_version >= "4.5" else "ffmpeg_4-headless" if inet_version >= "4.0" else None,  # ffmpeg needed for VoIPStream
             "python3" if inet_version >= "3.6.7" or is_modernized else "python2" # up to inet-3.6.6, inet_featuretool uses python2 in original, and python3 in modernized versions
             ],
-        "patch_commands": [
-            "touch tutorials/package.ned" if inet_version <= "4.2.1" and inet_version >= "3.6.0" else "",
-
+        "patch_operations": [
             # fix up shebang line in inet_featuretool (python -> python2)
-            "sed -i.bak 's| python$| python2|' inet_featuretool" if inet_version >= "3.0" and inet_version < "3.6.7" and not is_modernized else "",
+            {"op": "replace", "path": "inet_featuretool", "old": " python$", "new": " python2", "regex": True} if inet_version >= "3.0" and inet_version < "3.6.7" and not is_modernized else None,
 
             # fix "error: flexible array member in union" in sctp.h, later renamed to sctphdr.h
-            "sed -i.bak 's|info\\[\\]|info[0]|' src/inet/common/serializer/sctp/headers/sctphdr.h" if inet_version.startswith("3.") else "",
-            "sed -i.bak 's|info\\[\\]|info[0]|' src/util/headerserializers/sctp/headers/sctp.h" if inet_version.startswith("2.") else "",
+            {"op": "replace", "path": "src/inet/common/serializer/sctp/headers/sctphdr.h", "old": "info[]", "new": "info[0]"} if inet_version.startswith("3.") else None,
+            {"op": "replace", "path": "src/util/headerserializers/sctp/headers/sctp.h", "old": "info[]", "new": "info[0]"} if inet_version.startswith("2.") else None,
 
             # Linux appears to define "__linux__" nowadays, not "linux"; affected: serializer/headers/defs.h, ExtInterface.cc, RawSocket.cc, OsUdp.cc, Ext.cc, etc., and their renamed/moved versions
-            # Note: grep -s suppresses error messages about broken media/ softlinks under showcases and tutorials in 4.x versions
-            "for f in $(grep -Rls 'defined(linux)'); do sed -i.bak 's|defined(linux)|defined(__linux__)|' $f; done",
+            {"op": "replace", "path": "**", "old": "defined(linux)", "new": "defined(__linux__)"},
 
             # cResultFilterDescriptor was renamed in omnetpp-5.1
-            "sed -i.bak 's|cResultFilterDescriptor|cResultFilterType|' src/inet/common/figures/DelegateSignalConfigurator.cc" if inet_version == "3.4.0" else "",
+            {"op": "replace", "path": "src/inet/common/figures/DelegateSignalConfigurator.cc", "old": "cResultFilterDescriptor", "new": "cResultFilterType"} if inet_version == "3.4.0" else None,
 
             # PacketDrillApp bug in early 3.x versions
-            "sed -i.bak 's|->spp_hbinterval > 0|->spp_hbinterval->getNum() > 0|' src/inet/applications/packetdrill/PacketDrillApp.cc" if inet_version>="3.5.0" and inet_version<="3.6.1" else "",
-            "sed -i.bak 's|->spp_pathmaxrxt > 0|->spp_pathmaxrxt->getNum() > 0|' src/inet/applications/packetdrill/PacketDrillApp.cc" if inet_version>="3.5.0" and inet_version<="3.6.1" else "",
+            {"op": "replace", "path": "src/inet/applications/packetdrill/PacketDrillApp.cc", "old": "->spp_hbinterval > 0", "new": "->spp_hbinterval->getNum() > 0"} if inet_version>="3.5.0" and inet_version<="3.6.1" else None,
+            {"op": "replace", "path": "src/inet/applications/packetdrill/PacketDrillApp.cc", "old": "->spp_pathmaxrxt > 0", "new": "->spp_pathmaxrxt->getNum() > 0"} if inet_version>="3.5.0" and inet_version<="3.6.1" else None,
 
             # INT64_PRINTF_FORMAT was removed in omnetpp-5.3 (?), replace with "l" for simplicity (suits all 64-bit platforms except Windows)
-            "for f in $(grep -Rl 'INT64_PRINTF_FORMAT'); do sed -i.bak 's|INT64_PRINTF_FORMAT|\"l\"|' $f; done" if inet_version.startswith("3.") else "",
+            {"op": "replace", "path": "**", "old": "INT64_PRINTF_FORMAT", "new": "\"l\""} if inet_version.startswith("3.") else None,
 
             # fix linklayer/radio/Radio.cc:1134:35: error: redefinition of 'it' with a different type in inet-2.0 thru 2.2
-            "sed -i.bak 's/SensitivityList::iterator it = sensitivityList.find(0.0);/SensitivityList::iterator sit = sensitivityList.find(0.0);/' src/linklayer/radio/Radio.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.3" else None,
-            "sed -i.bak 's/if (it == sensitivityList.end())/if (sit == sensitivityList.end())/' src/linklayer/radio/Radio.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.3" else None,
+            {"op": "replace", "path": "src/linklayer/radio/Radio.cc", "old": "SensitivityList::iterator it = sensitivityList.find(0.0);", "new": "SensitivityList::iterator sit = sensitivityList.find(0.0);"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.3" else None,
+            {"op": "replace", "path": "src/linklayer/radio/Radio.cc", "old": "if (it == sensitivityList.end())", "new": "if (sit == sensitivityList.end())"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.3" else None,
 
             # fix networklayer/ipv4/RoutingTableRecorder.cc:166:35: error: invalid suffix on literal in inet-2.3
-            "sed -i.bak 's/\"LL\"/\" LL \"/' src/networklayer/ipv4/RoutingTableRecorder.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.5" else None,
+            {"op": "replace", "path": "src/networklayer/ipv4/RoutingTableRecorder.cc", "old": '"LL"', "new": '" LL "'} if not is_modernized and inet_version >= "2.0" and inet_version < "2.5" else None,
 
             # fix src/networklayer/manetrouting/dsr/dsr-uu/path-cache.cc
-            "sed -i.bak 's/if (vector_cost<=0)/if (vector_cost == NULL)/' src/networklayer/manetrouting/dsr/dsr-uu/path-cache.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "3.0" else None,
-            "sed -i.bak 's/if (vector_cost<=nullptr)/if (vector_cost == nullptr)/' src/inet/routing/extras/dsr/dsr-uu/path-cache.cc" if not is_modernized and inet_version >= "3.0" and inet_version < "3.1" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/dsr/dsr-uu/path-cache.cc", "old": "if (vector_cost<=0)", "new": "if (vector_cost == NULL)"} if not is_modernized and inet_version >= "2.0" and inet_version < "3.0" else None,
+            {"op": "replace", "path": "src/inet/routing/extras/dsr/dsr-uu/path-cache.cc", "old": "if (vector_cost<=nullptr)", "new": "if (vector_cost == nullptr)"} if not is_modernized and inet_version >= "3.0" and inet_version < "3.1" else None,
 
             # compile fix for omnetpp-4.3..4.6: getArraySize() was supposed to be renamed to getFieldArraySize() in omnetpp-4.3, but then the change was postponed to 5.0 as being a breaking change.
-            "sed -i.bak 's/OMNETPP_VERSION < 0x0403/OMNETPP_VERSION < 0x0500/' src/networklayer/manetrouting/aodv/aodv_msg_struct_descriptor.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
-            "sed -i.bak 's/OMNETPP_VERSION < 0x0403/OMNETPP_VERSION < 0x0500/' src/util/MessageChecker.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/aodv/aodv_msg_struct_descriptor.cc", "old": "OMNETPP_VERSION < 0x0403", "new": "OMNETPP_VERSION < 0x0500"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
+            {"op": "replace", "path": "src/util/MessageChecker.cc", "old": "OMNETPP_VERSION < 0x0403", "new": "OMNETPP_VERSION < 0x0500"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
 
             # fix no matching function for call to 'make_pair' in src/networklayer/manetrouting/base/ManetRoutingBase.cc (c++11 change in make_pair() signature)
-            "sed -i.bak 's/std::make_pair<Uint128,ProtocolsRoutes>(getAddress(),vect)/std::make_pair((Uint128)getAddress(),vect)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
-            "sed -i.bak 's/std::make_pair<Uint128,Uint128>(dst, gtwy)/std::make_pair((Uint128)dst, (Uint128)gtwy)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
-            "sed -i.bak 's/std::make_pair<Uint128,Uint128>(destination, nextHop)/std::make_pair((Uint128)destination, (Uint128)nextHop)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<Uint128,ProtocolsRoutes>(getAddress(),vect)", "new": "std::make_pair((Uint128)getAddress(),vect)"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<Uint128,Uint128>(dst, gtwy)", "new": "std::make_pair((Uint128)dst, (Uint128)gtwy)"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<Uint128,Uint128>(destination, nextHop)", "new": "std::make_pair((Uint128)destination, (Uint128)nextHop)"} if not is_modernized and inet_version >= "2.0" and inet_version < "2.1" else None,
 
-            "sed -i.bak 's/std::make_pair<ManetAddress,ProtocolsRoutes>(getAddress(),vect)/std::make_pair((ManetAddress)getAddress(),vect)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version == "2.1.0" else None,
-            "sed -i.bak 's/std::make_pair<ManetAddress,ManetAddress>(dst, gtwy)/std::make_pair((ManetAddress)dst, (ManetAddress)gtwy)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version == "2.1.0" else None,
-            "sed -i.bak 's/std::make_pair<ManetAddress,ManetAddress>(destination, nextHop)/std::make_pair((ManetAddress)destination, (ManetAddress)nextHop)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version == "2.1.0" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<ManetAddress,ProtocolsRoutes>(getAddress(),vect)", "new": "std::make_pair((ManetAddress)getAddress(),vect)"} if not is_modernized and inet_version == "2.1.0" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<ManetAddress,ManetAddress>(dst, gtwy)", "new": "std::make_pair((ManetAddress)dst, (ManetAddress)gtwy)"} if not is_modernized and inet_version == "2.1.0" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<ManetAddress,ManetAddress>(destination, nextHop)", "new": "std::make_pair((ManetAddress)destination, (ManetAddress)nextHop)"} if not is_modernized and inet_version == "2.1.0" else None,
 
             # fix no matching function for call to 'make_pair' in src/networklayer/manetrouting/base/ManetRoutingBase.cc (c++11 change in make_pair() signature)
-            "sed -i.bak 's/std::make_pair<ManetAddress,ProtocolsRoutes>(getAddress(),vect)/std::make_pair((ManetAddress)getAddress(),vect)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version >= "2.2" and inet_version < "2.4" else None,
-            "sed -i.bak 's/std::make_pair<ManetAddress,ManetAddress>(dest, next)/std::make_pair((ManetAddress)dest, (ManetAddress)next)/' src/networklayer/manetrouting/base/ManetRoutingBase.cc" if not is_modernized and inet_version >= "2.2" and inet_version < "2.4" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<ManetAddress,ProtocolsRoutes>(getAddress(),vect)", "new": "std::make_pair((ManetAddress)getAddress(),vect)"} if not is_modernized and inet_version >= "2.2" and inet_version < "2.4" else None,
+            {"op": "replace", "path": "src/networklayer/manetrouting/base/ManetRoutingBase.cc", "old": "std::make_pair<ManetAddress,ManetAddress>(dest, next)", "new": "std::make_pair((ManetAddress)dest, (ManetAddress)next)"} if not is_modernized and inet_version >= "2.2" and inet_version < "2.4" else None,
 
             # fix IPv6Address.cc:185: non-constant-expression cannot be narrowed from type 'unsigned int' to 'int' in initializer list in inet-2.1.0
-            "sed -i.bak 's/  int groups\\[8\\] = /  unsigned int groups[8] = /' src/networklayer/contract/IPv6Address.cc" if not is_modernized and inet_version < "2.2" else None,
-            "sed -i.bak 's/findGap(int \\*groups/findGap(unsigned int *groups/' src/networklayer/contract/IPv6Address.cc" if not is_modernized and inet_version < "2.2" else None,
+            {"op": "replace", "path": "src/networklayer/contract/IPv6Address.cc", "old": "  int groups[8] = ", "new": "  unsigned int groups[8] = "} if not is_modernized and inet_version < "2.2" else None,
+            {"op": "replace", "path": "src/networklayer/contract/IPv6Address.cc", "old": "findGap(int *groups", "new": "findGap(unsigned int *groups"} if not is_modernized and inet_version < "2.2" else None,
 
-            "sed -i.bak 's|precompiled.h|precompiled_$(MODE).h|' src/makefrag" if inet_version.startswith("3.5") else None,
+            {"op": "replace", "path": "src/makefrag", "old": "precompiled.h", "new": "precompiled_$(MODE).h"} if inet_version.startswith("3.5") else None,
+            ],
+        "patch_commands": [
+            "touch tutorials/package.ned" if inet_version <= "4.2.1" and inet_version >= "3.6.0" else "",
             """echo '#include "precompiled.h"' > src/inet/common/precompiled_debug.h""" if inet_version.startswith("3.5") else None,
             """echo '#include "precompiled.h"' > src/inet/common/precompiled_release.h""" if inet_version.startswith("3.5") else None,
             ],
@@ -227,12 +227,12 @@ inet_20100323 = {
     "name": "inet", "version": "20100323",
     "required_projects": {"omnetpp": ["4.1.0"]},        # TODO: try with 4.1.* -> build error
     "download_url": "https://github.com/inet-framework/inet/releases/download/master_20100323/inet-20100323-src.tgz",
-    "patch_commands": [
-        "sed -i 's|  int octals\\[8\\] = |  unsigned int octals[8] = |' src/networklayer/contract/IPv6Address.cc",
-        "sed -i 's|findGap(int \\*octals|findGap(unsigned int *octals|' src/networklayer/contract/IPv6Address.cc",
-        "sed -i 's|machine/endian|endian|' src/util/headerserializers/headers/defs.h",
-        "sed -i 's|info\\[\\]|info[0]|' src/util/headerserializers/headers/sctp.h",
-        "sed -i 's|addr.sin_len|// addr.sin_len|' src/linklayer/ext/*.cc",  # ugly hack? this is needed on apple
+    "patch_operations": [
+        {"op": "replace", "path": "src/networklayer/contract/IPv6Address.cc", "old": "  int octals[8] = ", "new": "  unsigned int octals[8] = "},
+        {"op": "replace", "path": "src/networklayer/contract/IPv6Address.cc", "old": "findGap(int *octals", "new": "findGap(unsigned int *octals"},
+        {"op": "replace", "path": "src/util/headerserializers/headers/defs.h", "old": "machine/endian", "new": "endian"},
+        {"op": "replace", "path": "src/util/headerserializers/headers/sctp.h", "old": "info[]", "new": "info[0]"},
+        {"op": "replace", "path": "src/linklayer/ext/*.cc", "old": "addr.sin_len", "new": "// addr.sin_len"},  # ugly hack? this is needed on apple
     ],
     "build_commands": ["make makefiles && make -j$NIX_BUILD_CORES MODE=release"],
     "clean_commands": ["make clean"],
@@ -242,9 +242,9 @@ inet_20061020 = {
     "name": "inet", "version": "20061020",
     "required_projects": {"omnetpp": ["3.3.1"]},        # TODO try with 3.3.* -> build error
     "download_url": "https://github.com/inet-framework/inet/releases/download/v1.x/INET-20061020-src.tgz",
-    "patch_commands": [
-        "sed -i 's|machine/endian|endian|' Util/HeaderSerializers/headers/defs.h",
-        "sed -i 's|ROOT=$(HOME)/INET-svn|ROOT=$(INET_ROOT)|' inetconfig",
+    "patch_operations": [
+        {"op": "replace", "path": "Util/HeaderSerializers/headers/defs.h", "old": "machine/endian", "new": "endian"},
+        {"op": "replace", "path": "inetconfig", "old": "ROOT=$(HOME)/INET-svn", "new": "ROOT=$(INET_ROOT)"},
     ],
     "build_commands": ["./makemake && make"],
     "clean_commands": ["make clean"],
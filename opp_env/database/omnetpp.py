@@ -88,12 +88,15 @@ def make_omnetpp_project_description(version, base_version=None, is_modernized=F
     python3package_packages = ["python3Packages.numpy", "python3Packages.scipy", "python3Packages.pandas", "python3Packages.matplotlib", "python3Packages.posix_ipc", "python3Packages.pyqt5"] if version >= "6.0" else []
 
     # Unreleased patch versions are produced by downloading the preceding release, then applying the diff downloaded from github.
+    # The files are downloaded by opp_env (through its download cache) before the patch commands run, except in local mode.
+    base_release_to_actual_version_patch_downloads = {} if version == base_version else {
+        "configure": f"{github_url}/raw/omnetpp-{base_version}/configure",
+        "configure.in": f"{github_url}/raw/omnetpp-{base_version}/configure.in",
+        "patchfile.diff": f"{github_url}/compare/omnetpp-{base_version}...omnetpp-{version}.patch",
+    }
     base_release_to_actual_version_patch_commands = [] if version == base_version else [
         f"echo 'Patching vanilla omnetpp-{base_version} to {git_branch_or_tag_name} from git...'",
         'if [ "$LOCAL_OPERATION" == "" ]; then',
-        f"  curl -L -sS -o configure {github_url}/raw/omnetpp-{base_version}/configure",
-        f"  curl -L -sS -o configure.in {github_url}/raw/omnetpp-{base_version}/configure.in",
-        f"  curl -L -sS -o patchfile.diff {github_url}/compare/omnetpp-{base_version}...omnetpp-{version}.patch",
         f"  git apply --whitespace=nowarn --allow-empty --exclude .gitignore --exclude 'ui/*' --exclude 'releng/*' --exclude '**/Makefile.vc' patchfile.diff",
         'else',
         f'  [ -d $OMNETPP_REPO/.git ] || error "Error: OMNETPP_REPO=$OMNETPP_REPO is not set or does not point to a git repository on the local disk (required for obtaining patch to upgrade base release omnetpp-{base_version} to requested version omnetpp-{version})"',
@@ -301,6 +304,7 @@ def make_omnetpp_project_description(version, base_version=None, is_modernized=F
                     f"{github_url}/releases/download/omnetpp-{base_version}/omnetpp-{base_version}-src-{os_name_x}.tgz" if base_version.startswith("5.") else # for versions 5.1 - 5.7 there are separate tarballs for each OS (linux or macosx)
                     f"{github_url}/releases/download/omnetpp-{base_version}/omnetpp-{base_version}-{os_name}-{'x86_64' if is_macos else arch_name}.tgz" if base_version == "6.0.0" or base_version == "6.0.1" else # for 6.0.0 and 6.0.1 there are separate tarballs for each architecture on Linux (x86_64, aarch64), but not on macOS (only x86_64)
                     f"{github_url}/releases/download/omnetpp-{base_version}/omnetpp-{base_version}-{os_name}-{arch_name}.tgz", # for later versions (6.0.2+) there are separate tarballs for each architecture on both Linux and macOS
+                "patch_downloads": base_release_to_actual_version_patch_downloads,
                 "patch_commands": [
                     *base_release_to_actual_version_patch_commands,
                     *source_patch_commands,
@@ -1,6 +1,5 @@
 import argparse
 import copy
-import itertools
 import json
 import logging
 import os
@@ -13,6 +12,25 @@ import importlib
 import importlib.metadata
 import platform
 import urllib.request
+import urllib.error
+import urllib.parse
+import tarfile
+import gzip
+import bz2
+import lzma
+import zipfile
+import stat
+import queue
+import threading
+import hashlib
+import pickle
+import glob
+import heapq
+import concurrent.futures
+import time
+import contextlib
+import fcntl
+import shlex
 
 # make sure that this run-time version check is in synch with the metadata for python requirement in the project.toml file.
 if sys.version_info < (3,9):
@@ -90,32 +108,70 @@ def join_lines(lines):
     return "\n".join([li for li in lines if li])
 
 def join_commands(commands):
-    assert type(commands) is list
+    assert type(commands) in (list, tuple)
     return "\n".join([cmd for cmd in commands if cmd])  # using ";" as separator also works, " && " should too (script runs on 'set -e' anyway) but doesn't
 
-def topological_sort(nodes, is_edge):
-    visited = set()
-    stack = []
-
-    def dfs_rec(node):
-        visited.add(node)
-        for neighbor in nodes:
-            if neighbor not in visited and is_edge(node, neighbor):
-                dfs_rec(neighbor)
-        stack.append(node)
-
-    for node in nodes:
-        if node not in visited:
-            dfs_rec(node)
+class ProjectDependencyGraph:
+    # The dependency graph of a set of project descriptions (typically the effective projects of a session), built
+    # once with adjacency lists. The projects are available in project_descriptions, sorted so that each project
+    # comes before the projects it depends on.
+    def __init__(self, project_descriptions):
+        project_descriptions = list(project_descriptions)
+        project_descriptions_by_name = {}
+        for p in project_descriptions:
+            project_descriptions_by_name.setdefault(p.name, []).append(p)
+        self.dependencies = { p: uniq([q for name in p.required_projects for q in project_descriptions_by_name.get(name, [])]) for p in project_descriptions }
+        self.dependents = { p: [] for p in project_descriptions }
+        for p, dependencies in self.dependencies.items():
+            for q in dependencies:
+                self.dependents[q].append(p)
+        self.project_descriptions = self._sort(project_descriptions)
+
+        # list dependencies in the sorted order
+        position = { p: i for i, p in enumerate(self.project_descriptions) }
+        for dependencies in self.dependencies.values():
+            dependencies.sort(key=position.get)
+
+    def _sort(self, project_descriptions):
+        # Kahn's algorithm: repeatedly take the project whose dependencies have all been taken (if there are
+        # several, the one that comes first in the input), then reverse the result
+        position = { p: i for i, p in enumerate(project_descriptions) }
+        num_remaining_dependencies = { p: len(dependencies) for p, dependencies in self.dependencies.items() }
+        ready = [ position[p] for p in project_descriptions if not num_remaining_dependencies[p] ]
+        heapq.heapify(ready)
+        result = []
+        while ready:
+            p = project_descriptions[heapq.heappop(ready)]
+            result.append(p)
+            for q in self.dependents[p]:
+                num_remaining_dependencies[q] -= 1
+                if not num_remaining_dependencies[q]:
+                    heapq.heappush(ready, position[q])
+        if len(result) < len(project_descriptions):
+            raise Exception(f"Circular dependency among projects: {' -> '.join([str(p) for p in self._find_cycle(num_remaining_dependencies)])}")
+        result.reverse()
+        return result
 
-    stack.reverse()
-    return stack
+    def _find_cycle(self, num_remaining_dependencies):
+        # follow not-yet-taken dependencies from a not-yet-taken project until a project repeats
+        path = [ next(p for p, n in num_remaining_dependencies.items() if n) ]
+        while path.count(path[-1]) < 2:
+            path.append(next(q for q in self.dependencies[path[-1]] if num_remaining_dependencies[q]))
+        return path[path.index(path[-1]):]
 
-def sort_by_project_dependencies(project_descriptions):
-    def depends_on(project_a, project_b):
-        return project_b.name in project_a.required_projects
-    sorted = topological_sort(project_descriptions, depends_on)
-    return sorted
+    def get_dependencies(self, project_description):
+        # transitive dependencies of the project, in the order they are discovered
+        todo = [project_description]
+        processed = set()
+        deps = []
+        while todo:
+            project = todo.pop()
+            if project not in processed:
+                new_deps = [p for p in self.dependencies[project] if p not in processed]
+                deps += new_deps
+                processed.add(project)
+                todo.extend(new_deps)
+        return deps
 
 def is_semver(version):
     # supported formats: "3.2", "3.2.1", "3.2p1" or "3.2.1.231125"
@@ -132,9 +188,16 @@ def parse_semver(version):
     major, minor, micro, nano = match.groups()
     return int(major), int(minor), int(micro) if micro is not None else 0, int(nano) if nano is not None else 0
 
-def version_matches(wildcard_version, version):
+def check_version_pattern(wildcard_version):
     if not re.match(r"^[^*?]+(\.\*)?$", wildcard_version):
         raise Exception(f"Unsupported version pattern '{wildcard_version}', only '.*' is allowed at the end")
+
+def version_prefixes(version):
+    # the prefixes X for which the "X.*" pattern matches the given version (see version_matches()), e.g. "3.3p1" -> ["3", "3.3", "3.3p1"]
+    return uniq([version[:i] for i in range(1, len(version)) if version[i] in ".p"] + [version])
+
+def version_matches(wildcard_version, version):
+    check_version_pattern(wildcard_version)
     if wildcard_version.endswith(".*"):
         truncated = wildcard_version[0:-2]
         return version == truncated or version.startswith(truncated+".") or version.startswith(truncated+"p") # "3.3.*" should match "3.3p1" too
@@ -214,6 +277,15 @@ def create_arg_parser():
             "locally cloned Git repositories as installation sources instead of network access. "
             "It expects the file system locations to be passed in via environment variables. "
             "It is primarily useful for testing purposes.")
+        elif name=="git-clone":  subparser.add_argument("--git-clone", choices=Workspace.GIT_CLONE_STRATEGIES, help=
+            "How to clone projects that are installed from a git repository: 'full' clones the whole repository (via a mirror in the user's cache directory); "
+            "'shallow' only fetches the selected branch or tag, without history (--single-branch --depth 1); 'partial' fetches the whole history "
+            "but without file contents, which are fetched on demand (--filter=blob:none). "
+            "With 'init', this sets the default for the workspace, otherwise the default is the workspace's setting, or 'full'.")
+        elif name=="from-bundle": subparser.add_argument("--from-bundle", metavar="FILE", help=
+            "Install from a bundle created with 'opp_env bundle create', without network access. Only the files and git repositories "
+            "of the projects being installed are taken from the bundle; they are added to the download cache and git mirrors in the user's cache directory. "
+            "Projects that are downloaded with custom commands (download_commands) cannot be installed from a bundle.")
         elif name=="isolated":    subparser.add_argument("-i", "--isolated", action=argparse.BooleanOptionalAction, default=False, help=
             "Run in a Nix-based isolated environment from the host operating system. The default is to run non-isolated.")
         elif name=="no-isolated": subparser.add_argument("-i", "--isolated", action=argparse.BooleanOptionalAction, default=True, help=
@@ -240,7 +312,8 @@ def create_arg_parser():
     add_arguments(subparser, [
         "workspace",
         "force-init",
-        "nixless-workspace"
+        "nixless-workspace",
+        "git-clone"
     ])
 
     subparser = subparsers.add_parser("install", help="Downloads and builds the specified projects in their environment",
@@ -260,7 +333,9 @@ def create_arg_parser():
         "mode",
         "no-isolated",
         "keep",
-        "local"
+        "local",
+        "git-clone",
+        "from-bundle"
     ])
 
     subparser = subparsers.add_parser("shell", help="Runs a shell in the environment of the specified projects",
@@ -283,7 +358,8 @@ def create_arg_parser():
         "quiet",
         "isolated",
         "keep",
-        "local"
+        "local",
+        "git-clone"
     ])
 
     subparser = subparsers.add_parser("run", help="Runs a command in the environment of the specified projects",
@@ -308,11 +384,28 @@ def create_arg_parser():
         "quiet",
         "no-isolated",
         "keep",
-        "local"
+        "local",
+        "git-clone"
+    ])
+
+    subparser = subparsers.add_parser("bundle", help="Creates a bundle of project sources for installing without network access",
+        description="Creates a single-file bundle of the files and git repositories needed to install the specified projects and their dependencies "
+                    "(with any of their options), for use with 'opp_env install --from-bundle' on machines without network access.")
+    subparser.add_argument("action", choices=["create"], help="The operation to perform")
+    add_arguments(subparser, [
+        "projects",
     ])
+    subparser.add_argument("-o", "--output", metavar="FILE", dest="bundle_file_name", required=True, help="The bundle file to create")
+    subparser.add_argument("-j", "--jobs", type=int, default=Workspace.MAX_PARALLEL_DOWNLOADS, help="Number of concurrent downloads")
 
     subparser = subparsers.add_parser("maint", help="Maintenance functions", description="Maintenance functions")
     subparser.add_argument("-u", "--update-catalog", metavar="download-items-dir", dest="catalog_dir", help="Update the opp_env installation commands in the model catalog of omnetpp.org. The argument should point to the `download-items/` subdir of a checked-out copy of the https://github.com/omnetpp/omnetpp.org/ repository.")
+    subparser.add_argument("--rebuild-cache", default=False, action='store_true', help="Rebuild the cached copy of the compiled project database in the user's cache directory")
+    subparser.add_argument("--clear-cache", default=False, action='store_true', help="Delete the cached copy of the compiled project database from the user's cache directory")
+    subparser.add_argument("--update-download-hashes", default=False, action='store_true', help="Download the files at the download_url's in the project database that have no known hash yet, and record their SHA-256 hashes in the database (download_hashes.json)")
+    subparser.add_argument("--prefetch", nargs="*", metavar="PROJECT", help="Download the files and git repositories used by the specified projects and their dependencies (all of them if none is specified), considering all project options, into the download cache and git mirrors in the user's cache directory. Prints a JSON summary to the standard output.")
+    subparser.add_argument("-j", "--jobs", type=int, default=Workspace.MAX_PARALLEL_DOWNLOADS, help="Number of concurrent downloads for --prefetch")
+    subparser.add_argument("--downloads-dir", metavar="DIR", help="With --prefetch, also place the downloaded files and git repositories into DIR, in the layout expected by the --local option of other subcommands via $DOWNLOADS_DIR")
 
     return parser
 
@@ -366,15 +459,113 @@ To run a simulation model directly with the latest version of OMNeT++, run:
 def get_version():
     return importlib.metadata.version("opp_env")
 
-def detect_nix():
+def get_cache_directory():
+    # user-level cache directory, shared by all workspaces
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "opp_env")
+
+def get_database_directory():
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "database")
+
+_database_fingerprint = None
+
+def get_database_fingerprint():
+    # Identifies the compiled project database. It covers the database files, the code that interprets them
+    # (this file), the opp_env and Python versions, and the platform/architecture values that omnetpp.py branches on.
+    global _database_fingerprint
+    if _database_fingerprint is None:
+        hash = hashlib.sha256()
+        database_dir = get_database_directory()
+        for fname in sorted(os.listdir(database_dir)):
+            if fname.endswith(".py") or fname.endswith(".json"):
+                with open(os.path.join(database_dir, fname), "rb") as f:
+                    hash.update(fname.encode() + b"\0" + f.read() + b"\0")
+        with open(os.path.realpath(__file__), "rb") as f:
+            hash.update(f.read() + b"\0")
+        hash.update(f"{get_version()} {platform.python_version()} {platform.system()} {platform.machine()}".encode())
+        _database_fingerprint = hash.hexdigest()[:16]
+    return _database_fingerprint
+
+@contextlib.contextmanager
+def file_lock(lock_file_name):
+    # exclusive lock across processes (and threads), held while in the "with" block
+    os.makedirs(os.path.dirname(lock_file_name), exist_ok=True)
+    with open(lock_file_name, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_file_atomically(fname, data):
+    # write into a temp file and rename it, so that concurrent readers never see a partially written file
+    dir = os.path.dirname(fname)
+    os.makedirs(dir, exist_ok=True)
+    fd, temp_fname = tempfile.mkstemp(dir=dir, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(temp_fname, fname)
+    except:
+        os.remove(temp_fname)
+        raise
+
+def probe_tools(tools, cache_file_name=None):
+    # Runs `<tool> --version` for each tool (concurrently), and returns their outputs, with None for tools that
+    # could not be run. If a cache file is given, results are reused as long as the tool's binary (as found by
+    # `shutil.which`, with symlinks resolved) has the same path, mtime and inode as at the time of probing.
+    def get_binary_key(tool):
+        path = shutil.which(tool)
+        if not path:
+            return None
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        return [path, stat.st_mtime_ns, stat.st_ino]
+
+    def probe(tool):
+        try:
+            _logger.debug(f"Running {tool} --version")
+            result = subprocess.run([tool, '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            return result.stdout.decode('utf-8')
+        except Exception as ex:
+            _logger.debug(f"Error: {ex}")
+            return None
+
+    cache = {}
+    if cache_file_name and os.path.isfile(cache_file_name):
+        try:
+            with open(cache_file_name) as f:
+                cache = json.load(f)
+        except Exception as ex:
+            _logger.debug(f"Ignoring unreadable tool cache {cache_file_name}: {ex}")
+
+    binary_keys = { tool: get_binary_key(tool) for tool in tools }
+    outputs = {}
+    tools_to_probe = []
+    for tool in tools:
+        if binary_keys[tool] is None:
+            outputs[tool] = None  # not on the PATH, so running it would fail anyway
+        elif tool in cache and cache[tool]["binary"] == binary_keys[tool]:
+            outputs[tool] = cache[tool]["output"]
+        else:
+            tools_to_probe.append(tool)
+
+    if tools_to_probe:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(tools_to_probe)) as executor:
+            outputs.update(zip(tools_to_probe, executor.map(probe, tools_to_probe)))
+        if cache_file_name:
+            cache = { tool: {"binary": binary_keys[tool], "output": outputs[tool]} for tool in tools if binary_keys[tool] is not None and outputs[tool] is not None }
+            try:
+                write_file_atomically(cache_file_name, json.dumps(cache, indent=4))
+            except OSError as ex:
+                _logger.debug(f"Could not write tool cache {cache_file_name}: {ex}")
+    return outputs
+
+def detect_nix(cache_file_name=None):
     minimum_nix_version = "2.9"
     # check nix is installed
-    try:
-        _logger.debug(f"Running nix --version")
-        result = subprocess.run(['nix', '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-        output = result.stdout.decode('utf-8')
-    except Exception as ex:
-        _logger.debug(f"Error: {ex}")
+    output = probe_tools(["nix"], cache_file_name)["nix"]
+    if output is None:
         raise Exception(f"Nix does not seem to be installed (running `nix --version` failed). You can install it from https://nixos.org/download.html or using your system's package manager (important: at least version {minimum_nix_version} is required). See also the --nixless-workspace option in the help.")
 
     # check it is recent enough
@@ -384,59 +575,75 @@ def detect_nix():
     if natural_less(nix_version, minimum_nix_version):
         raise Exception(f"Your Nix installation of version {nix_version} is too old, at least version {minimum_nix_version} is required. The newest version is available from https://nixos.org/download.html. See also the --nixless-workspace option in the help.")
 
-def detect_tools():
+def detect_tools(cache_file_name=None):
     tools = [ "bash", "git", "curl", "grep", "find", "xargs", "shasum", "tar", "gzip", "sed", "touch" ]
 
     is_macos = platform.system().lower() == "darwin"
     if not is_macos:
         tools.append("nproc")
 
-    errors = []
-    for tool in tools:
-        try:
-            result = subprocess.run([tool, '--version'], capture_output=True)
-        except Exception as ex:
-            errors.append(tool)
+    outputs = probe_tools(tools, cache_file_name)
+    errors = [tool for tool in tools if outputs[tool] is None]
     if errors:
         raise Exception(f"The following programs were not found: {', '.join(errors)}.")
 
 class ProjectDescription:
+    # the fields, in the order they appear in the JSON output of 'opp_env info --raw'
+    __slots__ = ("name", "version", "description", "details", "warnings",
+                 "nixos", "stdenv", "folder_name",
+                 "required_projects", "nix_packages", "vars_to_keep",
+                 "download_url", "download_sha256", "git_url", "git_branch", "download_commands",
+                 "patch_commands", "patch_url", "patch_downloads", "patch_operations",
+                 "shell_hook_commands", "setenv_commands",
+                 "build_commands", "clean_commands", "smoke_test_commands", "test_commands",
+                 "potential_build_inputs", "potential_build_outputs",
+                 "options", "metadata")
+
+    DEFAULT_POTENTIAL_BUILD_INPUTS = ( "src/*", "*.cc", "*.cxx", "*.c", "*.h", "*.hpp", "*.hh", "*.msg", "Makefile", "*/Makefile", "makefrag", "*/makefrag" )
+    DEFAULT_POTENTIAL_BUILD_OUTPUTS = ( "out/*", "*.o", "*.a", "*.a.*", "*.so", "*.so.*", "*.dylib", "*.dylib.*", "*.dll", "*.exe", ":noext" )
+
+    _activated_project_descriptions = {}  # memo for activate_project_options(): { (description, effective options): activated description }
+
     def __init__(self, name, version, description=None, details=None, warnings=[],
                  nixos=None, stdenv=None, folder_name=None,
                  required_projects={}, nix_packages=[], vars_to_keep=[],
-                 download_url=None, git_url=None, git_branch=None, download_commands=[],
-                 patch_commands=[], patch_url=None,
+                 download_url=None, download_sha256=None, git_url=None, git_branch=None, download_commands=[],
+                 patch_commands=[], patch_url=None, patch_downloads={}, patch_operations=[],
                  shell_hook_commands=[], setenv_commands=[],
                  build_commands=[], clean_commands=[], smoke_test_commands=[], test_commands=[],
                  potential_build_inputs=None, potential_build_outputs=None,
                  options=None, metadata=None):
+        # list-valued fields are stored as (immutable) tuples; empty ones all share the empty tuple
         def remove_empty(list):
-            return [x for x in list if x] if list else []
-        self.name = name
-        self.version = version
+            return tuple(x for x in list if x) if list else ()
+        self.name = sys.intern(name)
+        self.version = sys.intern(version)
         self.description = description
         self.details = details
         self.warnings = remove_empty(warnings)
         self.nixos = nixos
         self.stdenv = stdenv
-        self.folder_name = folder_name or name
+        self.folder_name = sys.intern(folder_name) if folder_name else self.name
         self.required_projects = required_projects
         self.nix_packages = remove_empty(nix_packages)
         self.vars_to_keep = remove_empty(vars_to_keep)
         self.download_url = download_url
+        self.download_sha256 = download_sha256  # expected SHA-256 of the file at download_url; filled in from database/download_hashes.json (if that exists) if not given
         self.git_url = git_url
         self.git_branch = git_branch
         self.download_commands = remove_empty(download_commands)
         self.patch_commands = remove_empty(patch_commands)
         self.patch_url = patch_url
+        self.patch_downloads = patch_downloads  # { file name: URL }, downloaded into the project directory before the patch commands run (except in local mode)
+        self.patch_operations = remove_empty(patch_operations)  # declarative edits applied in-process before the patch commands run, see PatchOperations
         self.shell_hook_commands = remove_empty(shell_hook_commands)
         self.setenv_commands = remove_empty(setenv_commands)
         self.build_commands = remove_empty(build_commands)
         self.clean_commands = remove_empty(clean_commands)
         self.smoke_test_commands = remove_empty(smoke_test_commands)
         self.test_commands = remove_empty(test_commands)
-        self.potential_build_inputs = potential_build_inputs or [ "src/*", "*.cc", "*.cxx", "*.c", "*.h", "*.hpp", "*.hh", "*.msg", "Makefile", "*/Makefile", "makefrag", "*/makefrag" ]
-        self.potential_build_outputs = potential_build_outputs or [ "out/*", "*.o", "*.a", "*.a.*", "*.so", "*.so.*", "*.dylib", "*.dylib.*", "*.dll", "*.exe", ":noext" ]
+        self.potential_build_inputs = tuple(potential_build_inputs) if potential_build_inputs else ProjectDescription.DEFAULT_POTENTIAL_BUILD_INPUTS
+        self.potential_build_outputs = tuple(potential_build_outputs) if potential_build_outputs else ProjectDescription.DEFAULT_POTENTIAL_BUILD_OUTPUTS
         self.options = options or {}
         self.metadata = metadata or {}  # examples: catalog_url, release_year, original_version
 
@@ -444,7 +651,7 @@ class ProjectDescription:
         for option_name, option_entries in self.options.items():
             for field_name, field_value in option_entries.items():
                 if type(field_value) is list:
-                    field_value[:] = remove_empty(field_value)
+                    option_entries[field_name] = remove_empty(field_value)
 
         if bool(download_url) + bool(git_url) + bool(download_commands) > 1:
             raise Exception(f"project {name}-{version}: download_url, git_url, and download_commands are mutually exclusive")
@@ -460,6 +667,10 @@ class ProjectDescription:
     def __str__(self):
         return self.get_full_name()
 
+    def as_dict(self):
+        # the equivalent of vars() for this slotted class
+        return {field_name: getattr(self, field_name) for field_name in ProjectDescription.__slots__}
+
     def get_full_name(self, colored=False):
         full_name = self.name + "-" + self.version
         return cyan(full_name) if colored else full_name
@@ -491,11 +702,16 @@ class ProjectDescription:
                 if not get_conflicting_options(option, effective_options):
                     effective_options.append(option)
 
-        new_project_description = copy.deepcopy(self)
+        if effective_options and not quiet:
+            _logger.debug(f"Selecting options {cyan(requested_options)} for project {cyan(self)}")
 
-        if effective_options:
-            if not quiet:
-                _logger.debug(f"Selecting options {cyan(requested_options)} for project {cyan(self)}")
+        # The result is a shallow copy of this description with the option fields overlaid on it, i.e. it shares
+        # all unchanged field values (lists, the options dict, etc.) with this one, so they must not be modified in place.
+        # Results are memoized per effective option list.
+        key = (self, tuple(effective_options))
+        new_project_description = ProjectDescription._activated_project_descriptions.get(key)
+        if new_project_description is None:
+            new_project_description = copy.copy(self)
             for option in effective_options:
                 if option in self.options:
                     for field_name, field_value in self.options[option].items():
@@ -503,12 +719,15 @@ class ProjectDescription:
                             setattr(new_project_description, field_name, field_value)
                 else:
                     _logger.warning(f"Project {cyan(self)} does not support option {cyan(option)}")
+            ProjectDescription._activated_project_descriptions[key] = new_project_description
         return new_project_description
 
 class ProjectReference:
+    __slots__ = ("name", "version")
+
     def __init__(self, name, version):
-        self.name = name
-        self.version = version
+        self.name = sys.intern(name)
+        self.version = sys.intern(version)
 
     def __repr__(self):
         return self.get_full_name()
@@ -525,47 +744,205 @@ class ProjectReference:
         return self.name + "-" + self.version if self.version else self.name
 
 class ProjectRegistry:
-    def __init__(self):
-        self.all_project_descriptions = self.collect_project_descriptions()
-        self.index = self.build_index(self.all_project_descriptions)
+    # python modules and json files under database/, in the order their projects are listed
+    DATABASE_SOURCES = [
+        "omnetpp",
+        "inet",
+        "veins",
+        "simulte",
+        "simu5g",
+        "external",
+        "external.json"
+    ]
+    TEMP_DIR_GRACE_PERIOD = 5 * 60  # temp dirs younger than this (in seconds) are never removed, as another process may be writing the cache into them
+
+    def __init__(self, use_cache=True):
+        self.use_cache = use_cache
+        self.project_descriptions_by_source = {}  # only contains the sources loaded so far
+        self.all_project_descriptions = None
+        self.index = {}
+        self.project_versions = {}  # { name: [versions] }, in registry order
+        # The manifest maps project names to the database sources that define them. It is generated together
+        # with the cache, and allows loading only the sources of the projects that are actually used.
+        self.manifest = self.load_manifest() if use_cache else None
+        if self.manifest is None:
+            self.load_all_sources()
+            if use_cache:
+                self.save_cache()
 
-    def collect_project_descriptions(self):
-        python_files = [
-            "omnetpp",
-            "inet",
-            "veins",
-            "simulte",
-            "simu5g",
-            "external"
-        ]
+    @staticmethod
+    def get_cache_directory():
+        return os.path.join(get_cache_directory(), f"registry-{get_database_fingerprint()}")
 
-        json_files = [
-            "external.json"
-        ]
+    def load_manifest(self):
+        manifest_file_name = os.path.join(self.get_cache_directory(), "manifest.json")
+        try:
+            with open(manifest_file_name) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.debug(f"Could not load project database manifest {cyan(manifest_file_name)}: {e}")
+            return None
+        self.project_sources = {}
+        for source, project_names in manifest.items():
+            for project_name in project_names:
+                self.project_sources.setdefault(project_name, []).append(source)
+        return manifest
+
+    def save_cache(self):
+        # write the shards and the manifest into a temp dir, then rename it, so readers never see a partial cache
+        cache_dir = self.get_cache_directory()
+        try:
+            ProjectRegistry.clear_cache(stale_only=True)  # remove entries left over from earlier database versions
+            os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+            temp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir), prefix="registry-tmp-")
+            manifest = {}
+            for source, project_descriptions in self.project_descriptions_by_source.items():
+                with open(os.path.join(temp_dir, source + ".pickle"), "wb") as f:
+                    pickle.dump(project_descriptions, f, protocol=pickle.HIGHEST_PROTOCOL)
+                manifest[source] = uniq([p.name for p in project_descriptions])
+            with open(os.path.join(temp_dir, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(temp_dir, cache_dir)
+            except OSError:
+                shutil.rmtree(temp_dir)  # another process was faster
+            _logger.debug(f"Saved project database to cache {cyan(cache_dir)}")
+        except Exception as e:
+            _logger.debug(f"Could not save project database to cache {cyan(cache_dir)}: {e}")
 
-        all_project_descriptions = []
-        for fname in python_files:
-            module = importlib.import_module("opp_env.database." + fname)
-            raw_project_descriptions = module.get_project_descriptions()
-            project_descriptions = [ProjectDescription(**e) for e in raw_project_descriptions]
-            all_project_descriptions += project_descriptions
+    @staticmethod
+    def clear_cache(stale_only=False):
+        # stale_only=True keeps the cache of the current database version
+        current_cache_dir = ProjectRegistry.get_cache_directory()
+        now = time.time()
+        for fname in glob.glob(os.path.join(get_cache_directory(), "registry-*")):
+            if stale_only and fname == current_cache_dir:
+                continue
+            try:
+                if os.path.basename(fname).startswith("registry-tmp-") and os.stat(fname).st_mtime > now - ProjectRegistry.TEMP_DIR_GRACE_PERIOD:
+                    continue
+                if os.path.isdir(fname):
+                    shutil.rmtree(fname)
+                else:
+                    os.remove(fname)
+            except FileNotFoundError:
+                pass  # renamed or removed concurrently
+
+    def load_all_sources(self):
+        sources = [source for source in self.DATABASE_SOURCES if source not in self.project_descriptions_by_source]
+        if sources:
+            if self.manifest is not None:
+                self.load_sources(sources)
+            else:
+                self.add_project_descriptions(self.collect_project_descriptions())
 
-        for fname in json_files:
-            with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "database", fname)) as f:
-                all_project_descriptions += [ProjectDescription(**e) for e in json.load(f)]
+    def load_sources(self, sources):
+        # load the given database sources from the cache, plus the ones that define projects with the same names
+        # (all versions of a project must be loaded together for the index to be correct)
+        todo = list(sources)
+        sources = []
+        while todo:
+            source = todo.pop(0)
+            if source not in sources and source not in self.project_descriptions_by_source:
+                sources.append(source)
+                todo += [s for project_name in self.manifest.get(source, []) for s in self.project_sources[project_name]]
+        if not sources:
+            return
+        cache_dir = self.get_cache_directory()
+        try:
+            loaded = {}
+            for source in sources:
+                with open(os.path.join(cache_dir, source + ".pickle"), "rb") as f:
+                    loaded[source] = pickle.load(f)
+            _logger.debug(f"Loaded {', '.join(sources)} from project database cache {cyan(cache_dir)}")
+        except Exception as e:
+            _logger.debug(f"Could not load project database from cache {cyan(cache_dir)}: {e}")
+            self.manifest = None
+            self.project_descriptions_by_source = {}
+            self.index = {}
+            self.project_versions = {}
+            self.load_all_sources()
+            return
+        self.add_project_descriptions(loaded)
+
+    def add_project_descriptions(self, project_descriptions_by_source):
+        self.project_descriptions_by_source.update(project_descriptions_by_source)
+        new_project_descriptions = [p for source in self.DATABASE_SOURCES for p in project_descriptions_by_source.get(source, [])]
+        self.index.update(self.build_index(new_project_descriptions))
+        for p in new_project_descriptions:
+            self.project_versions.setdefault(p.name, []).append(p.version)
+        self.all_project_descriptions = None
+
+    def load_project(self, project_name):
+        # make sure the descriptions of the given project are loaded
+        if project_name not in self.index and self.manifest is not None:
+            self.load_sources(self.project_sources.get(project_name, []))
+
+    def collect_project_descriptions(self):
+        project_descriptions_by_source = {}
+        for source in self.DATABASE_SOURCES:
+            if source.endswith(".json"):
+                with open(os.path.join(get_database_directory(), source)) as f:
+                    raw_project_descriptions = json.load(f)
+            else:
+                module = importlib.import_module("opp_env.database." + source)
+                raw_project_descriptions = module.get_project_descriptions()
+            project_descriptions_by_source[source] = [ProjectDescription(**e) for e in raw_project_descriptions]
+
+        self.fill_in_download_hashes([p for project_descriptions in project_descriptions_by_source.values() for p in project_descriptions])
 
         # expand to wildcard versions such as "4.2.*" to list of matching versions
-        return [self.expand_wildcards_in_project_dependencies(p, all_project_descriptions) for p in all_project_descriptions]
+        self.expand_wildcards_in_all_project_dependencies([p for project_descriptions in project_descriptions_by_source.values() for p in project_descriptions])
+        return project_descriptions_by_source
+
+    @staticmethod
+    def get_download_hashes_file_name():
+        # SHA-256 hashes of the files at the download_url's in the database, created with 'opp_env maint --update-download-hashes'
+        return os.path.join(get_database_directory(), "download_hashes.json")
+
+    @staticmethod
+    def load_download_hashes():
+        file_name = ProjectRegistry.get_download_hashes_file_name()
+        if not os.path.isfile(file_name):
+            return None
+        with open(file_name) as f:
+            return json.load(f)
+
+    def fill_in_download_hashes(self, project_descriptions):
+        # until the hashes file exists, only the hashes given explicitly in the project descriptions are used
+        download_hashes = self.load_download_hashes()
+        if download_hashes is None:
+            return
+        for p in project_descriptions:
+            if p.download_url and not p.download_sha256:
+                p.download_sha256 = download_hashes.get(p.download_url)
+            for option_entries in p.options.values():
+                # an option that changes the download_url must also change download_sha256, even if the new hash is unknown
+                if option_entries.get("download_url") and not option_entries.get("download_sha256"):
+                    option_entries["download_sha256"] = download_hashes.get(option_entries["download_url"])
+
+    def get_all_download_urls(self):
+        return uniq([url for p in self.get_all_project_descriptions() for url in [p.download_url, *[o.get("download_url") for o in p.options.values()]] if url])
 
     def get_all_project_descriptions(self):
+        if self.all_project_descriptions is None:
+            self.load_all_sources()
+            self.all_project_descriptions = [p for source in self.DATABASE_SOURCES for p in self.project_descriptions_by_source[source]]
         return self.all_project_descriptions
 
     def get_project_names(self, project_descriptions=None):
+        if project_descriptions is None and self.manifest is not None:
+            return uniq([project_name for source in self.DATABASE_SOURCES for project_name in self.manifest.get(source, [])])
         return uniq([p.name for p in project_descriptions or self.get_all_project_descriptions()])
 
     def get_project_versions(self, project_name, project_descriptions=None):
         # Note: this does not include "pseudo" versions like "latest", or "omnetpp-4" that means "omnetpp-4.6.1"
-        return [p.version for p in project_descriptions or self.get_all_project_descriptions() if p.name == project_name]
+        if project_descriptions is not None:
+            return [p.version for p in project_descriptions if p.name == project_name]
+        self.load_project(project_name)
+        return list(self.project_versions.get(project_name, []))
 
     def build_index(self, project_descriptions):
         # index structure: { name: {version: description}}
@@ -595,12 +972,14 @@ class ProjectRegistry:
 
     def get_project_version_aliases(self, project_reference):
         # collect version aliases for a given project; e.g. if project_reference is "omnetpp-6.0.2", then it may return ["6", "6.0", "latest"]
+        self.load_project(project_reference.name)
         version_to_project_dict = self.index[project_reference.name]
         return [v for v,p in version_to_project_dict.items() if p.version != v and p.version == project_reference.version]
 
     def get_project_description(self, project_reference):
         if type(project_reference) is str:
             project_reference = ProjectReference.parse(project_reference)
+        self.load_project(project_reference.name)
         if project_reference.name not in self.index:
             raise Exception(f"Cannot resolve '{project_reference}': " + self.get_unknown_project_message(project_reference.name))
         if not project_reference.version:
@@ -612,31 +991,57 @@ class ProjectRegistry:
             _logger.debug(f"Resolved {cyan(project_reference)} as {cyan(project_description)}")
         return project_description
 
-    def expand_wildcards_in_project_dependencies(self, project_description, all_project_descriptions):
-        def expand(project_name, version, all_project_descriptions):
+    def expand_wildcards_in_all_project_dependencies(self, project_descriptions):
+        # Index the versions of each project by the prefixes that "X.*" patterns can match, so expansion does
+        # not need to scan all project descriptions for every pattern. Index structure: { name: { prefix: [versions] } }
+        version_index = {}
+        for p in project_descriptions:
+            project_index = version_index.setdefault(p.name, {})
+            for prefix in version_prefixes(p.version):
+                project_index.setdefault(prefix, []).append(p.version)
+        for p in project_descriptions:
+            self.expand_wildcards_in_project_dependencies(p, version_index)
+
+    def expand_wildcards_in_project_dependencies(self, project_description, version_index):
+        def expand(project_name, version):
             if not '*' in version:
                 return [ version ]
-            candidates = self.get_project_versions(project_name, all_project_descriptions)
-            return [ candidate for candidate in candidates if version_matches(version, candidate) ]
+            check_version_pattern(version)
+            return list(version_index.get(project_name, {}).get(version[:-2], []))
 
-        def expand_all(project_name, versions, all_project_descriptions):
+        def expand_all(project_name, versions):
             result = []
             for version in versions:
-                result += expand(project_name, version, all_project_descriptions)
+                result += expand(project_name, version)
             return result
 
-        project_description.required_projects = { project_name: expand_all(project_name, versions, all_project_descriptions)
+        project_description.required_projects = { project_name: expand_all(project_name, versions)
             for project_name, versions in project_description.required_projects.items() }
 
         return project_description
 
-    def compute_effective_project_descriptions(self, specified_project_descriptions, requested_options=None):
-        selected_project_descriptions = self.expand_dependencies(specified_project_descriptions)
-        if not selected_project_descriptions:
-            raise Exception("The specified set of project versions cannot be satisfied")
+    def compute_effective_project_descriptions(self, specified_project_descriptions, requested_options=None, resolution_cache=None):
+        key = ResolutionCache.make_key("effective", specified_project_descriptions, requested_options)
+        selected_project_names = resolution_cache.get(key) if resolution_cache else None
+        if selected_project_names is not None:
+            _logger.debug(f"Using cached list of effective projects for {specified_project_descriptions}")
+            selected_project_descriptions = [self.get_project_description(name) for name in selected_project_names]
+        else:
+            selected_project_descriptions = self.expand_dependencies(specified_project_descriptions)
+            if not selected_project_descriptions:
+                raise Exception("The specified set of project versions cannot be satisfied")
+            if resolution_cache:
+                resolution_cache.put(key, [p.get_full_name() for p in selected_project_descriptions])
         return activate_project_options(selected_project_descriptions, requested_options)
 
     def expand_dependencies(self, specified_project_descriptions, return_all=False):
+        # returns the first acceptable combination, or with return_all=True, a generator that yields all of them
+        combinations = self.generate_dependency_combinations(specified_project_descriptions)
+        if return_all:
+            return combinations
+        return next(combinations, [])
+
+    def generate_dependency_combinations(self, specified_project_descriptions):
         _logger.debug(f"Computing list of effective projects for {specified_project_descriptions}")
         # 1. collect all required projects ignoring the project versions
         required_project_names = []
@@ -651,53 +1056,53 @@ class ProjectRegistry:
                 else:
                     todo_list.append(self.get_project_description(ProjectReference.parse(project_name + "-" + project_versions[0])))
                 required_project_names.append(project_name)
-        required_project_names.reverse()
+        required_project_names = uniq(reversed(required_project_names))
         # _logger.debug(f"{required_project_names=}")
 
-        # 2. collect all available project versions for all required projects separately
-        available_project_versions = { name: self.get_project_versions(name) for name in required_project_names }
-        # _logger.debug(f"{available_project_versions=}")
-
-        # 3. iterate over all combinations of the available project versions for the different required projects
-        result = []
-        sets = available_project_versions.values()
-        keys = list(available_project_versions.keys())
-        for combination in itertools.product(*sets):
-            # _logger.debug(f"checking combination: {combination=}")
-            accept_combination = True
-            selected_project_descriptions = []
-            # 4. turn the combination of version numbers (a tuple of strings) into a tuple of project descriptions
-            for i in range(len(combination)):
-                selected_project_name = f"{keys[i]}-{combination[i]}"
-                selected_project_description = self.get_project_description(ProjectReference.parse(selected_project_name))
-                selected_project_descriptions.append(selected_project_description)
-            # _logger.debug(f"checking combination: {selected_project_descriptions=}")
-            # 5. check if the specified project versions are included in the project version combination
-            for specified_project_description in specified_project_descriptions:
-                if not specified_project_description in selected_project_descriptions:
-                    # _logger.debug(f"  rejecting because {specified_project_description} is not in {selected_project_descriptions}")
-                    accept_combination = False
-                    break
-            # 6. check if one of the required project versions are included in the project version combination for all project versions
-            for selected_project_description in selected_project_descriptions:
-                # _logger.debug(f"  checking {selected_project_description}")
-                for required_project_name, required_project_versions in selected_project_description.required_projects.items():
-                    accept_selected_project_description = False
-                    for required_project_version in required_project_versions:
-                        required_project_description = self.get_project_description(ProjectReference.parse(required_project_name + "-" + required_project_version))
-                        if required_project_description in selected_project_descriptions:
-                            accept_selected_project_description = True
-                    if not accept_selected_project_description:
-                        # _logger.debug(f"  rejecting {required_project_name} {required_project_versions}")
-                        accept_combination = False
+        # 2. collect the candidate versions (domain) of each required project, in registry order
+        accepted_project_descriptions = {} # { description: { required_project_name: set of acceptable descriptions } }
+        def get_accepted_project_descriptions(project_description):
+            if project_description not in accepted_project_descriptions:
+                accepted_project_descriptions[project_description] = { name: set(self.get_project_description(ProjectReference(name, version)) for version in versions)
+                    for name, versions in project_description.required_projects.items() }
+            return accepted_project_descriptions[project_description]
+
+        domains = []
+        for name in required_project_names:
+            domain = [self.get_project_description(ProjectReference(name, version)) for version in self.get_project_versions(name)]
+            # the specified project versions must be included in the combination
+            specified = uniq([p for p in specified_project_descriptions if p.name == name])
+            if specified:
+                domain = [p for p in domain if p in specified] if len(specified) == 1 else []
+            # a project cannot be selected if it requires a project that is not part of the combination at all
+            domain = [p for p in domain if all(required_project_name in required_project_names for required_project_name in get_accepted_project_descriptions(p))]
+            domains.append(domain)
+
+        def is_compatible(project_a, project_b):
+            accepted = get_accepted_project_descriptions(project_a).get(project_b.name)
+            if accepted is not None and project_b not in accepted:
+                return False
+            accepted = get_accepted_project_descriptions(project_b).get(project_a.name)
+            return accepted is None or project_a in accepted
+
+        # 3. backtracking search with forward checking: once a project version is selected, the versions of the
+        # remaining projects that are incompatible with it are pruned. Projects are assigned in the same order as
+        # the Cartesian product of the domains would be iterated, so the combinations are found in the same order.
+        def search(i, domains, selected_project_descriptions):
+            if i == len(domains):
+                yield list(reversed(selected_project_descriptions))  # most derived project first, omnetpp last (usually)
+                return
+            for project_description in domains[i]:
+                pruned_domains = []
+                for domain in domains[i+1:]:
+                    pruned_domain = [p for p in domain if is_compatible(project_description, p)]
+                    if not pruned_domain:
                         break
-            if accept_combination:
-                selected_project_descriptions = list(reversed(selected_project_descriptions))  # most derived project first, omnetpp last (usually)
-                if return_all:
-                    result.append(selected_project_descriptions)
+                    pruned_domains.append(pruned_domain)
                 else:
-                    return selected_project_descriptions
-        return result
+                    yield from search(i+1, domains[:i+1] + pruned_domains, selected_project_descriptions + [project_description])
+
+        return search(0, domains, [])
 
     def get_unknown_project_message(self, project_name):
         def jaccard_similarity(word1, word2):
@@ -715,6 +1120,1225 @@ class ProjectRegistry:
         else:
             return f"Unknown project '{project_name}'. Did you mean '{most_similar}'?"
 
+class ResolutionCache:
+    # Persistent memo of dependency resolution results, stored as JSON. Results are only valid for the project
+    # database they were computed from, so all entries are discarded when the database fingerprint changes.
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.entries = {}
+        self.modified = False
+        try:
+            with open(file_name) as f:
+                data = json.load(f)
+            if data.get("fingerprint") == get_database_fingerprint():
+                self.entries = data.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            _logger.debug(f"Ignoring unreadable resolution cache {cyan(file_name)}: {e}")
+
+    @staticmethod
+    def make_key(kind, project_descriptions, requested_options=None):
+        return json.dumps([kind, [p.get_full_name() for p in project_descriptions], requested_options or []])
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.modified = True
+
+    def save(self):
+        if self.modified:
+            try:
+                write_file_atomically(self.file_name, json.dumps({"fingerprint": get_database_fingerprint(), "entries": self.entries}))
+                self.modified = False
+            except Exception as e:
+                _logger.debug(f"Could not save resolution cache {cyan(self.file_name)}: {e}")
+
+class PrefixedReader:
+    # File-like object that returns the given bytes, then continues reading from the stream
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b""
+        elif size > len(self.prefix):
+            data, self.prefix = self.prefix + self.stream.read(size - len(self.prefix)), b""
+        else:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+class PipedProcess:
+    # An external program whose standard input is fed from fileobj by a thread, and whose output can be read like
+    # a file, e.g. a decompressor like pigz. The program thus runs in parallel with the consumer of its output.
+    def __init__(self, command, fileobj, capture_output=True):
+        self.command = command
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE if capture_output else subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.feeder_error = None
+        self.feeder = threading.Thread(target=self._feed, args=(fileobj,), daemon=True)
+        self.feeder.start()
+
+    def _feed(self, fileobj):
+        try:
+            while data := fileobj.read(1024*1024):
+                self.process.stdin.write(data)
+        except BrokenPipeError:
+            pass  # the decompressor exited; its exit code tells why
+        except BaseException as e:
+            self.feeder_error = e
+        finally:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self, error=False):
+        if error:
+            self.process.kill()
+        elif self.process.stdout:
+            self.process.stdout.read()  # the consumer may stop before the end, e.g. at the end-of-archive marker of a tar file
+        stderr = self.process.stderr.read().decode(errors="replace").strip()
+        self.process.wait()
+        self.feeder.join()
+        for stream in [self.process.stdout, self.process.stderr]:
+            if stream:
+                stream.close()
+        if not error:
+            if self.feeder_error:
+                raise self.feeder_error
+            if self.process.returncode != 0:
+                raise Exception(f"'{' '.join(self.command)}' failed with exit code {self.process.returncode}: {stderr}")
+
+class ReadAheadReader:
+    # File-like object that reads from the stream a few chunks ahead on a background thread. It is used for
+    # running in-process decompression in parallel with the extraction, as zlib, lzma and bz2 release the GIL.
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, stream, max_chunks=4):
+        self.queue = queue.Queue(max_chunks)
+        self.chunk = b""
+        self.pos = 0
+        self.eof = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def _run(self, stream):
+        try:
+            while not self.closed:
+                data = stream.read(ReadAheadReader.CHUNK_SIZE)
+                self.queue.put(data)
+                if not data:
+                    break
+        except BaseException as e:
+            self.queue.put(e)
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.pos == len(self.chunk):
+                if self.eof:
+                    break
+                item = self.queue.get()
+                if isinstance(item, BaseException):
+                    raise item
+                self.chunk, self.pos, self.eof = item, 0, not item
+                continue
+            n = len(self.chunk) - self.pos if size < 0 else min(size, len(self.chunk) - self.pos)
+            parts.append(self.chunk[self.pos:self.pos+n])
+            self.pos += n
+            if size > 0:
+                size -= n
+        return b"".join(parts)
+
+    def close(self, error=False):
+        # unblock and stop the thread
+        self.closed = True
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+def open_decompressed(fileobj, parallel=True):
+    # Returns a file-like object that reads the decompressed content of fileobj, detecting the compression
+    # format from the leading "magic" bytes. This is used instead of tarfile's "r|*" mode, because that one
+    # gets very slow on highly compressible content, and does not know zstd. With parallel=True, decompression
+    # runs in parallel with the consumer: in a faster, multi-threaded external program if one is installed
+    # (pigz etc.), otherwise on a background thread. (This is faster even on a single CPU, as the consumer
+    # typically waits for I/O.) The returned object has a close(error=False) method, which must be called,
+    # and which raises an exception if decompression failed.
+    def open_with(commands, open_in_process):
+        for command in commands:
+            if (parallel or not open_in_process) and shutil.which(command[0]):
+                return PipedProcess(command, fileobj)
+        if not open_in_process:
+            raise Exception(f"Cannot decompress data: '{commands[0][0]}' is not installed")
+        return ReadAheadReader(open_in_process(fileobj)) if parallel else ClosingReader(open_in_process(fileobj))
+
+    magic = fileobj.read(6)
+    fileobj = PrefixedReader(magic, fileobj)
+    if magic.startswith(b"\x1f\x8b"):
+        return open_with([["pigz", "-dc"]], lambda f: gzip.GzipFile(fileobj=f, mode="rb"))
+    elif magic.startswith(b"BZh"):
+        return open_with([["lbzip2", "-dc"], ["pbzip2", "-dc"]], lambda f: bz2.BZ2File(f, mode="rb"))
+    elif magic.startswith(b"\xfd7zXZ\x00"):
+        return open_with([["xz", "-dc", "-T0"]], lambda f: lzma.LZMAFile(f, mode="rb"))
+    elif magic.startswith(b"\x28\xb5\x2f\xfd"):
+        try:
+            from compression import zstd  # Python 3.14+
+            open_in_process = lambda f: zstd.ZstdFile(f, mode="rb")
+        except ImportError:
+            open_in_process = None
+        return open_with([["zstd", "-dc"]], open_in_process)
+    else:
+        return ClosingReader(fileobj)  # assume uncompressed
+
+class ClosingReader:
+    # Adds the close(error=False) method of the objects returned by open_decompressed() to a plain stream
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def close(self, error=False):
+        pass
+
+def extract_tarball(fileobj, target_folder, strip_components=1, parallel=True, use_tar_program=None):
+    # Extracts a (possibly compressed) tarball read sequentially from fileobj, i.e. it also works on a download
+    # stream. Like `tar --strip-components=N`, the first N components of member paths are removed, and members
+    # that have nothing left are skipped. Zip archives are also accepted. The decompressed stream is extracted
+    # by the tar program if it is installed (it is several times faster than tarfile on archives with many files),
+    # otherwise in-process.
+    magic = fileobj.read(4)
+    fileobj = PrefixedReader(magic, fileobj)
+    if magic == b"PK\x03\x04":
+        extract_zip(fileobj, target_folder, strip_components)
+        return
+    if use_tar_program is None:
+        use_tar_program = shutil.which("tar") is not None
+    stream = open_decompressed(fileobj, parallel)
+    try:
+        if use_tar_program:
+            PipedProcess(["tar", "-x", "-f", "-", f"--strip-components={strip_components}", "-C", target_folder], stream, capture_output=False).close()
+        else:
+            extract_tar_stream(stream, target_folder, strip_components)
+    except BaseException:
+        stream.close(error=True)
+        raise
+    stream.close()
+
+def extract_tar_stream(stream, target_folder, strip_components=1):
+    # in-process implementation of extract_tarball(), for an uncompressed stream
+    def strip(path):
+        return "/".join(path.lstrip("/").split("/")[strip_components:])
+    has_filters = hasattr(tarfile, "tar_filter")  # Python 3.12, and security updates of earlier versions
+    directories = []
+    with tarfile.open(fileobj=stream, mode="r|") as tar:
+        for member in tar:
+            member.name = strip(member.name)
+            if not member.name:
+                continue
+            if member.islnk():
+                member.linkname = strip(member.linkname)  # hard links refer to other members
+            if has_filters:
+                member = tarfile.tar_filter(member, target_folder)  # like GNU tar, refuse to write outside target_folder
+            if member.isdir():
+                directories.append(member)
+            tar.extract(member, target_folder, set_attrs=not member.isdir(), **({"filter": "fully_trusted"} if has_filters else {}))
+
+        # set directory attributes at the end, like tar does, because e.g. a read-only directory could not be extracted into
+        for member in reversed(directories):
+            dirpath = os.path.join(target_folder, member.name)
+            tar.chown(member, dirpath, False)
+            tar.utime(member, dirpath)
+            tar.chmod(member, dirpath)
+
+def extract_zip(fileobj, target_folder, strip_components=1):
+    # The directory of a zip archive is at its end, so it cannot be extracted sequentially like a tarball:
+    # the content is first copied into an (anonymous) temporary file, outside the tree being extracted. Permissions
+    # and symlinks are restored from the Unix attributes stored in the archive, if any. Like tarfile's "tar" filter,
+    # this refuses symlinks that point outside target_folder, and members that would be written through a symlink.
+    def strip(path):
+        return "/".join(path.lstrip("/").split("/")[strip_components:])
+    def check_path(path, name):
+        # path must be inside target_folder, and neither it nor its parent directories may be symlinks
+        if not is_subdirectory(path, root):
+            raise Exception(f"Refusing to extract {name} outside the target folder")
+        parent = path
+        while parent != root:
+            if os.path.islink(parent):
+                raise Exception(f"Refusing to extract {name} through the symlink {os.path.relpath(parent, root)}")
+            parent = os.path.dirname(parent)
+    os.makedirs(target_folder, exist_ok=True)
+    root = os.path.abspath(target_folder)
+    with tempfile.TemporaryFile() as f:
+        shutil.copyfileobj(fileobj, f, 1024*1024)
+        with zipfile.ZipFile(f) as archive:
+            directories = []
+            for info in archive.infolist():
+                info.filename = strip(info.filename)
+                if not info.filename:
+                    continue
+                mode = info.external_attr >> 16
+                path = os.path.abspath(os.path.join(root, info.filename))
+                check_path(path, info.filename)
+                if stat.S_ISLNK(mode):
+                    link_target = archive.read(info).decode()
+                    if os.path.isabs(link_target) or not is_subdirectory(os.path.normpath(os.path.join(os.path.dirname(path), link_target)), root):
+                        raise Exception(f"Refusing to extract symlink {info.filename} pointing outside the target folder: {link_target}")
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.symlink(link_target, path)
+                    continue
+                path = archive.extract(info, target_folder)  # note: this sanitizes the path
+                if info.is_dir():
+                    directories.append((path, info))
+                else:
+                    if mode:
+                        os.chmod(path, stat.S_IMODE(mode))
+                    os.utime(path, (time.mktime(info.date_time + (0, 0, -1)),) * 2)
+            # set directory attributes at the end, like for tarballs
+            for path, info in reversed(directories):
+                if info.external_attr >> 16:
+                    os.chmod(path, stat.S_IMODE(info.external_attr >> 16))
+                os.utime(path, (time.mktime(info.date_time + (0, 0, -1)),) * 2)
+
+class PatchOperations:
+    # Declarative source patches (the patch_operations field of project descriptions), an alternative to running sed
+    # and the like in patch_commands. Each operation is a dict with an "op" and a "path", the latter being a path
+    # relative to the project root, or a glob pattern ("*", "?" and "[...]" match within a path segment, "**" matches
+    # any number of segments, e.g. "**" is all files). The operations:
+    #   {"op": "replace", "path": ..., "old": ..., "new": ...}: replaces text in every line, like sed's "s" command,
+    #       i.e. only the first occurrence in each line unless "all" is true. With "regex": true, "old" is a Python
+    #       regular expression (matched against lines without the newline) and "new" may contain references like "\1";
+    #   {"op": "insert_before"/"insert_after", "path": ..., "line": ..., "text": ...}: inserts text (one or more lines)
+    #       before/after every line that contains "line" (or matches it, with "regex": true);
+    #   {"op": "delete", "path": ...}: deletes the matching files and directories (after all edits).
+    # All operations of a project are applied together: the tree is walked once (only if there are glob patterns), and
+    # each affected file is read and written once. Files are replaced, not modified in place (see SourceTreeStore).
+    # A path that does not exist is an error, a glob pattern that matches nothing is not. Walking the tree skips
+    # symlinks and .git directories.
+    OPS = ["replace", "insert_before", "insert_after", "delete"]
+
+    def __init__(self, operations):
+        self.operations = [self._compile(operation) for operation in operations]  # (operation, path pattern or None, edit function or None)
+
+    def _compile(self, operation):
+        op, path = operation.get("op"), operation.get("path")
+        if op not in PatchOperations.OPS:
+            raise Exception(f"Invalid patch operation {operation}: 'op' should be one of: {', '.join(PatchOperations.OPS)}")
+        if not path or os.path.isabs(path) or ".." in path.split("/"):
+            raise Exception(f"Invalid patch operation {operation}: 'path' should be a relative path inside the project")
+        pattern = PatchOperations.glob_to_regex(path) if any(c in path for c in "*?[") else None
+        if op == "replace":
+            old, new, count = operation["old"], operation["new"], 0 if operation.get("all") else 1
+            if operation.get("regex"):
+                regex, multiline_regex = re.compile(old), re.compile(old, re.MULTILINE)
+                edit = lambda text: "\n".join([regex.sub(new, line, count) for line in text.split("\n")]) if multiline_regex.search(text) else text
+            elif count == 0 and "\n" not in old:
+                edit = lambda text: text.replace(old, new)
+            else:
+                edit = lambda text: "\n".join([line.replace(old, new, 1) for line in text.split("\n")]) if old in text else text
+        elif op in ["insert_before", "insert_after"]:
+            line_pattern, text_to_insert = operation["line"], operation["text"].rstrip("\n")
+            matches = re.compile(line_pattern).search if operation.get("regex") else lambda line: line_pattern in line
+            before = op == "insert_before"
+            def edit(text):
+                lines = []
+                for line in text.split("\n"):
+                    if before and matches(line):
+                        lines.append(text_to_insert)
+                    lines.append(line)
+                    if not before and matches(line):
+                        lines.append(text_to_insert)
+                return "\n".join(lines)
+        else:
+            edit = None
+        return operation, pattern, edit
+
+    @staticmethod
+    def glob_to_regex(pattern):
+        def translate(segment):
+            regex, i = "", 0
+            while i < len(segment):
+                c = segment[i]
+                j = segment.find("]", i + 2) if c == "[" else -1
+                if c == "*":
+                    regex += "[^/]*"
+                elif c == "?":
+                    regex += "[^/]"
+                elif j != -1:
+                    regex += "[" + ("^" + segment[i+2:j] if segment[i+1] == "!" else segment[i+1:j]) + "]"
+                    i = j
+                else:
+                    regex += re.escape(c)
+                i += 1
+            return regex
+        segments = pattern.split("/")
+        regex = ""
+        for i, segment in enumerate(segments):
+            last = i == len(segments) - 1
+            if segment == "**":
+                regex += "(?:[^/]+/)*[^/]+" if last else "(?:[^/]+/)*"
+            else:
+                regex += translate(segment) + ("" if last else "/")
+        return re.compile(regex + r"\Z")
+
+    def apply(self, root_dir):
+        files, dirs = self._walk(root_dir) if any(pattern for _, pattern, _ in self.operations) else ([], [])
+        edits = {}  # relative path -> edit functions, in the order of the operations
+        deletions = []
+        for operation, pattern, edit in self.operations:
+            if pattern is None:
+                if not os.path.lexists(os.path.join(root_dir, operation["path"])):
+                    raise Exception(f"Patch operation {operation}: {operation['path']} does not exist")
+                matched = [os.path.normpath(operation["path"])]
+            else:
+                matched = [path for path in (files + dirs if edit is None else files) if pattern.match(path)]
+            for path in matched:
+                if edit is None:
+                    deletions.append(path)
+                else:
+                    edits.setdefault(path, []).append(edit)
+        _logger.debug(f"Applying {len(self.operations)} patch operation(s) in {cyan(root_dir)}: editing {len(edits)} file(s), deleting {len(deletions)}")
+        for path, edit_functions in edits.items():
+            self._edit_file(os.path.join(root_dir, path), edit_functions)
+        for path in deletions:
+            path = os.path.join(root_dir, path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):  # may have been in a deleted directory
+                os.remove(path)
+
+    def _walk(self, root_dir):
+        # returns the relative paths of the files and directories in the tree
+        files, dirs = [], []
+        def walk(dir, prefix):
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if entry.is_symlink():
+                        continue
+                    elif entry.is_dir():
+                        if entry.name != ".git":
+                            dirs.append(prefix + entry.name)
+                            walk(entry.path, prefix + entry.name + "/")
+                    else:
+                        files.append(prefix + entry.name)
+        walk(root_dir, "")
+        return files, dirs
+
+    def _edit_file(self, file_name, edit_functions):
+        # files are treated as UTF-8, but any other content is preserved as well; line endings are left alone
+        with open(file_name, encoding="utf-8", errors="surrogateescape", newline="") as f:
+            text = f.read()
+        new_text = text
+        for edit in edit_functions:
+            new_text = edit(new_text)
+        if new_text == text:
+            return
+        fd, temp_file_name = tempfile.mkstemp(dir=os.path.dirname(file_name), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+                f.write(new_text)
+            os.chmod(temp_file_name, stat.S_IMODE(os.stat(file_name).st_mode))
+            os.replace(temp_file_name, file_name)
+        except:
+            os.remove(temp_file_name)
+            raise
+
+    @staticmethod
+    def from_sed_command(command):
+        # Converts a patch command that edits files with sed (one "s", "/re/i" or "/re/a" command, applied to one or
+        # more files, or to the files found by a "grep -R" loop with the same pattern) into the equivalent patch
+        # operations. Returns None if the command has some other form. Note that the backup files of "sed -i.bak"
+        # are not created.
+        m = re.fullmatch(r"for (\w+) in \$\(grep -R[ls]* '([^']*)'\); do (sed .*) \$\1; done", command.strip())
+        if m:
+            operations = PatchOperations.from_sed_command(m.group(3) + " ANY_FILE")
+            if not operations or operations[0]["op"] != "replace":
+                return None
+            grep_regex = PatchOperations.sed_regex_to_python(m.group(2), False)
+            if grep_regex != operations[0]["old"] and PatchOperations.regex_to_literal(grep_regex or "") != operations[0]["old"]:
+                return None  # the sed command only changes the files grep finds
+            return [{**operations[0], "path": "**"}]
+        try:
+            lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            args = list(lexer)
+        except ValueError:
+            return None
+        if len(args) < 3 or args[0] != "sed" or any(arg and all(c in "();<>|&" for c in arg) for arg in args):
+            return None
+        in_place, extended, script, files = False, False, None, []
+        args = iter(args[1:])
+        for arg in args:
+            if arg.startswith("-i") or arg.startswith("--in-place"):
+                in_place = True
+            elif arg in ["-E", "-r", "--regexp-extended"]:
+                extended = True
+            elif arg == "-e" and script is None:
+                script = next(args, None)
+            elif arg.startswith("-"):
+                return None
+            elif script is None:
+                script = arg
+            else:
+                files.append(arg)
+        if not in_place or not script or not files:
+            return None
+        if f"'{script}'" not in command or any(c in file for file in files for c in "$`\\\"'~{"):
+            return None  # might be affected by shell expansion
+        operation = PatchOperations._convert_sed_script(script, extended)
+        return [{**operation, "path": file} for file in files] if operation else None
+
+    @staticmethod
+    def _convert_sed_script(script, extended):
+        m = re.fullmatch(r"/((?:[^/\\]|\\.)*)/([ia])\s*([^\\]+)", script)
+        if m:
+            line = PatchOperations.sed_regex_to_python(m.group(1), extended)
+            literal_line = PatchOperations.regex_to_literal(line) if line is not None else None
+            operation = {"op": "insert_before" if m.group(2) == "i" else "insert_after", "line": line, "text": m.group(3)}
+            if literal_line is not None:
+                operation["line"] = literal_line
+            else:
+                operation["regex"] = True
+            return operation if line is not None else None
+        if len(script) < 2 or script[0] != "s" or script[1] in "\\\n":
+            return None
+        # split at the unescaped delimiters, removing the escapes of the delimiter
+        delimiter, parts, current, i = script[1], [], "", 2
+        while i < len(script):
+            if script[i] == "\\" and i + 1 < len(script):
+                current += script[i+1] if script[i+1] == delimiter else script[i:i+2]
+                i += 2
+            elif script[i] == delimiter:
+                parts.append(current)
+                current, i = "", i + 1
+            else:
+                current += script[i]
+                i += 1
+        parts.append(current)
+        if len(parts) != 3 or parts[2] not in ["", "g"]:
+            return None
+        old, new = PatchOperations.sed_regex_to_python(parts[0], extended), PatchOperations.sed_replacement_to_python(parts[1])
+        if old is None or new is None:
+            return None
+        literal_old, literal_new = PatchOperations.regex_to_literal(old), PatchOperations.sed_replacement_to_python(parts[1], literal=True)
+        if literal_old is not None and literal_new is not None:
+            operation = {"op": "replace", "old": literal_old, "new": literal_new}
+        else:
+            operation = {"op": "replace", "old": old, "new": new, "regex": True}
+        if parts[2] == "g":
+            operation["all"] = True
+        return operation
+
+    @staticmethod
+    def sed_regex_to_python(regex, extended):
+        # converts a POSIX basic (or with extended=True, extended) regular expression as understood by GNU sed into a Python one; returns None for unsupported constructs
+        result, i, n = "", 0, len(regex)
+        while i < n:
+            c = regex[i]
+            if c == "\\":
+                if i + 1 == n:
+                    return None
+                d = regex[i+1]
+                if not extended and d in "(){}+?|":
+                    result += d
+                elif d.isdigit():
+                    result += "\\" + d
+                elif d == "n":
+                    result += "\\n"
+                elif d.isalnum() or d in "<>`'":
+                    return None  # GNU extensions like \w and \<
+                else:
+                    result += "\\" + d
+                i += 2
+            elif c == "[":
+                j = i + 1
+                j += regex[j:j+1] == "^"
+                j += regex[j:j+1] == "]"
+                end = regex.find("]", j)
+                if end == -1 or "[:" in regex[i+1:end] or "[=" in regex[i+1:end] or "[." in regex[i+1:end]:
+                    return None
+                content = regex[i+1:end]
+                negated = content.startswith("^")
+                content = content[1:] if negated else content
+                result += "[" + ("^" if negated else "") + content.replace("\\", "\\\\").replace("[", "\\[").replace("]", "\\]") + "]"
+                i = end + 1
+            elif not extended and c in "(){}+?|":
+                result += "\\" + c
+                i += 1
+            elif not extended and (c == "*" and (i == 0 or regex[:i] == "^" or regex[i-2:i] == "\\(") or c == "^" and i > 0 and regex[i-2:i] != "\\(" or c == "$" and i < n - 1 and regex[i+1:i+3] != "\\)"):
+                result += "\\" + c  # literal in these positions in BREs
+                i += 1
+            else:
+                result += c
+                i += 1
+        return result
+
+    @staticmethod
+    def sed_replacement_to_python(replacement, literal=False):
+        # converts the replacement part of a sed "s" command into a Python replacement template, or with literal=True,
+        # into the replacement string (or None if it contains references to the match)
+        result, i = "", 0
+        while i < len(replacement):
+            c = replacement[i]
+            if c == "\\" and i + 1 < len(replacement):
+                d = replacement[i+1]
+                if d.isdigit():
+                    if literal:
+                        return None
+                    result += f"\\g<{d}>"
+                elif d == "n":
+                    result += "\n"
+                elif d == "\\":
+                    result += "\\" if literal else "\\\\"
+                else:
+                    result += d
+                i += 2
+            elif c == "&":
+                if literal:
+                    return None
+                result += "\\g<0>"
+                i += 1
+            elif c == "\\":
+                return None
+            else:
+                result += c
+                i += 1
+        return result
+
+    @staticmethod
+    def regex_to_literal(regex):
+        # returns the string the Python regex matches if it has no special characters, otherwise None
+        result, i = "", 0
+        while i < len(regex):
+            c = regex[i]
+            if c == "\\":
+                if i + 1 == len(regex) or regex[i+1].isalnum():
+                    return None
+                result += regex[i+1]
+                i += 2
+            elif c in ".^$*+?{}[]()|":
+                return None
+            else:
+                result += c
+                i += 1
+        return result
+
+class DownloadProgress:
+    # Prints the progress of a download on a single, repeatedly overwritten line, if stderr is a terminal
+    def __init__(self, url, total_size=None):
+        self.label = os.path.basename(urllib.parse.urlparse(url).path) or url
+        self.total_size = total_size
+        self.size = 0
+        self.enabled = sys.stderr.isatty()
+        self.last_update = 0
+
+    def update(self, num_bytes):
+        self.size += num_bytes
+        now = time.monotonic()
+        if self.enabled and now - self.last_update > 0.2:
+            self.last_update = now
+            self.print()
+
+    def print(self, end=""):
+        MiB = 1024 * 1024
+        total = f" / {self.total_size/MiB:.1f} MiB ({100*self.size//self.total_size}%)" if self.total_size else " MiB"
+        print(f"\r  {self.label}: {self.size/MiB:.1f}{total}", end=end, file=sys.stderr, flush=True)
+
+    def done(self):
+        if self.enabled:
+            self.print(end="\n")
+
+class HashingReader:
+    # File-like object that reads from a stream while computing the SHA-256 of the data, and optionally copying it into a file
+    def __init__(self, stream, copy_to=None, progress=None):
+        self.stream = stream
+        self.copy_to = copy_to
+        self.progress = progress
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hash.update(data)
+        if self.copy_to:
+            self.copy_to.write(data)
+        if self.progress:
+            self.progress.update(len(data))
+        return data
+
+    def read_to_end(self):
+        while self.read(1024*1024):
+            pass
+
+    def verify(self, expected_sha256, what):
+        # to be called after reading everything
+        sha256 = self.hash.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            raise Exception(f"Checksum mismatch for {what}: expected SHA-256 {expected_sha256}, got {sha256}")
+
+class DownloadCache:
+    # User-level cache of downloaded files (release tarballs, etc.), shared by all workspaces. Files are stored
+    # by the SHA-256 of their content under objects/, and small records under urls/ map each URL to the hash of
+    # the content downloaded from it, so the same content is only stored once even if it is available under
+    # several URLs. The total size is kept under a limit by evicting the least recently used files.
+    DEFAULT_MAX_SIZE_MB = 10 * 1024  # can be overridden with $OPP_ENV_DOWNLOAD_CACHE_SIZE (in megabytes)
+    EVICTION_GRACE_PERIOD = 10 * 60  # files used this recently (in seconds) are never evicted, as they may be in use by another process
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or os.path.join(get_cache_directory(), "downloads")
+        self.max_size = max_size if max_size is not None else int(os.environ.get("OPP_ENV_DOWNLOAD_CACHE_SIZE") or DownloadCache.DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+
+    def get_object_file_name(self, sha256):
+        return os.path.join(self.directory, "objects", sha256[:2], sha256)
+
+    def get_url_record_file_name(self, url):
+        return os.path.join(self.directory, "urls", hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def lookup(self, url, sha256=None):
+        # returns the name of the cached file for the URL (or with the given content hash, if known), or None
+        if sha256:
+            fname = self.get_object_file_name(sha256.lower())
+            if os.path.isfile(fname):
+                os.utime(fname)  # mark as recently used
+                return fname
+        try:
+            with open(self.get_url_record_file_name(url)) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.debug(f"Ignoring unreadable download cache record for {cyan(url)}: {e}")
+            return None
+        fname = self.get_object_file_name(record["sha256"])
+        if record.get("url") != url or not os.path.isfile(fname) or (sha256 and record["sha256"] != sha256.lower()):
+            return None
+        os.utime(fname)  # mark as recently used
+        return fname
+
+    def lookup_hash(self, url):
+        # returns the hash of the content last downloaded from the URL, even if the file itself has been evicted since, or None
+        try:
+            with open(self.get_url_record_file_name(url)) as f:
+                record = json.load(f)
+            return record["sha256"] if record.get("url") == url else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.debug(f"Ignoring unreadable download cache record for {cyan(url)}: {e}")
+            return None
+
+    def fetch(self, url, consumer=None, sha256=None, revalidate=False):
+        # Returns the name of the cached file for the URL, downloading it first if needed. If a consumer function is
+        # given, it is called with a file object to read the content from (e.g. to extract a tarball). If the expected
+        # SHA-256 of the content is given, the download is verified against it. With revalidate=True, a cached file is
+        # only used after the server has confirmed that it has not changed; use it for content that is not immutable
+        # (e.g. diffs against a branch), unless the hash is known.
+        fname = self.lookup(url, sha256)
+        if fname and revalidate and not sha256:
+            with self.lock(url):
+                fname = self.revalidate(url, fname)
+            self.evict(keep=fname)
+        elif fname:
+            _logger.debug(f"Using cached download {cyan(fname)} for {cyan(url)}")
+        else:
+            with self.lock(url):
+                fname = self.lookup(url, sha256)  # another process may have downloaded it while we were waiting for the lock
+                if not fname:
+                    fname = self.download(url, sha256)
+            self.evict(keep=fname)
+        if consumer:
+            with open(fname, "rb") as f:
+                reader = HashingReader(f)
+                try:
+                    consumer(reader)
+                finally:
+                    # the file name is the hash of its content, so this also catches corruption of the cached file
+                    reader.read_to_end()
+                    if reader.hash.hexdigest() != os.path.basename(fname):
+                        os.remove(fname)
+                        raise Exception(f"Cached download {fname} of {url} is corrupted; it was removed from the cache, please try again")
+        return fname
+
+    def revalidate(self, url, fname):
+        # makes a conditional request with the validators (ETag, Last-Modified) recorded at download, and downloads the file again if it has changed
+        try:
+            with open(self.get_url_record_file_name(url)) as f:
+                record = json.load(f)
+            new_fname = self.download(url, validators=record)
+        except Exception as e:
+            _logger.warning(f"Could not check whether {cyan(url)} has changed, using the cached download: {e}")
+            return fname
+        if not new_fname:
+            _logger.debug(f"Cached download {cyan(fname)} for {cyan(url)} is up to date")
+            return fname
+        return new_fname
+
+    def lock(self, url):
+        # serializes downloads of the same URL across processes, as they would share the partial file
+        return file_lock(self.get_partial_file_name(url, ".lock"))
+
+    def get_partial_file_name(self, url, suffix):
+        return os.path.join(self.directory, "partial", hashlib.sha256(url.encode()).hexdigest() + suffix)
+
+    CHECKPOINT_INTERVAL = 8 * 1024 * 1024  # bytes
+
+    def download(self, url, sha256=None, validators=None):
+        # The data is first written into a partial file, with a sidecar JSON file that records the URL, the validator
+        # (ETag or Last-Modified) sent by the server, and the number of bytes written. If the download is interrupted,
+        # the next attempt resumes it with an HTTP Range request, unless the validator shows that the file has changed.
+        # If validators of a previous download are given, the request is conditional, and None is returned if the
+        # file has not changed since.
+        _logger.info(f"Downloading {cyan(url)}")
+        partial_file_name = self.get_partial_file_name(url, ".part")
+        state_file_name = self.get_partial_file_name(url, ".json")
+        try:
+            with open(state_file_name) as f:
+                state = json.load(f)
+            offset = min(state["offset"], os.path.getsize(partial_file_name)) if state.get("url") == url else 0
+            validator = state.get("etag") or state.get("last_modified")
+        except (FileNotFoundError, ValueError, KeyError):
+            offset, validator = 0, None
+
+        request = urllib.request.Request(url)
+        if offset and validator and not validators:
+            _logger.info(f"Resuming download of {cyan(url)} at {offset/1024/1024:.1f} MiB")
+            request.add_header("Range", f"bytes={offset}-")
+            request.add_header("If-Range", validator)
+        else:
+            offset = 0
+            if validators and validators.get("etag"):
+                request.add_header("If-None-Match", validators["etag"])
+            if validators and validators.get("last_modified"):
+                request.add_header("If-Modified-Since", validators["last_modified"])
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and validators:  # 304: Not Modified
+                return None
+            if e.code != 416 or not offset:  # 416: Range Not Satisfiable
+                raise Exception(f"Could not download {url}: {e}") from e
+            os.remove(partial_file_name)
+            return self.download(url, sha256)
+        except Exception as e:
+            raise Exception(f"Could not download {url}: {e}") from e
+
+        with response:
+            if response.status != 206 or not (response.headers.get("Content-Range") or "").startswith(f"bytes {offset}-"):
+                offset = 0  # the server sent the whole file
+            state = { "url": url, "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"), "offset": offset }
+            content_length = response.headers.get("Content-Length")
+            total_size = offset + int(content_length) if content_length else None
+            progress = DownloadProgress(url, total_size)
+            progress.update(offset)
+            os.makedirs(os.path.dirname(partial_file_name), exist_ok=True)
+            with open(partial_file_name, "r+b" if offset else "wb") as f:
+                # hash the data downloaded previously, then continue writing after it
+                previous_data_reader = HashingReader(f)
+                while f.tell() < offset and previous_data_reader.read(min(1024*1024, offset - f.tell())):
+                    pass
+                f.truncate()
+                write_file_atomically(state_file_name, json.dumps(state))
+                reader = HashingReader(response, f, progress)
+                reader.hash = previous_data_reader.hash
+                last_checkpoint = offset
+                try:
+                    while chunk := reader.read(1024*1024):
+                        state["offset"] += len(chunk)
+                        if state["offset"] - last_checkpoint >= self.CHECKPOINT_INTERVAL:
+                            f.flush()
+                            write_file_atomically(state_file_name, json.dumps(state))
+                            last_checkpoint = state["offset"]
+                    if total_size is not None and state["offset"] != total_size:
+                        # note: urllib does not report a connection closed prematurely as an error
+                        raise ConnectionError(f"Connection closed after {state['offset']} of {total_size} bytes")
+                except BaseException as e:
+                    f.flush()
+                    write_file_atomically(state_file_name, json.dumps(state))
+                    if isinstance(e, OSError):
+                        raise Exception(f"Could not download {url}: {e} (the {state['offset']/1024/1024:.1f} MiB downloaded so far will be reused next time)") from e
+                    raise
+                finally:
+                    progress.done()
+
+        os.remove(state_file_name)
+        try:
+            reader.verify(sha256, url)
+        except:
+            os.remove(partial_file_name)
+            raise
+        fname = self._add_object(url, partial_file_name, reader.hash.hexdigest(), state["etag"], state["last_modified"])
+        _logger.debug(f"Downloaded {cyan(url)} into the download cache as {cyan(fname)}")
+        return fname
+
+    def store(self, url, fileobj, sha256=None):
+        # adds the content read from the file object (e.g. a member of a bundle) to the cache, as the content of the URL
+        partial_file_name = self.get_partial_file_name(url, ".import")
+        os.makedirs(os.path.dirname(partial_file_name), exist_ok=True)
+        with open(partial_file_name, "wb") as f:
+            reader = HashingReader(fileobj, f)
+            reader.read_to_end()
+        try:
+            reader.verify(sha256, url)
+        except:
+            os.remove(partial_file_name)
+            raise
+        return self._add_object(url, partial_file_name, reader.hash.hexdigest())
+
+    def _add_object(self, url, file_name, sha256, etag=None, last_modified=None):
+        fname = self.get_object_file_name(sha256)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        os.replace(file_name, fname)
+        write_file_atomically(self.get_url_record_file_name(url), json.dumps({"url": url, "sha256": sha256, "etag": etag, "last_modified": last_modified}))
+        return fname
+
+    def evict(self, keep=None):
+        objects = []
+        for fname in glob.glob(os.path.join(self.directory, "objects", "*", "*")):
+            try:
+                stat = os.stat(fname)
+                objects.append((stat.st_mtime, stat.st_size, fname))
+            except FileNotFoundError:
+                pass  # removed concurrently
+        total_size = sum(size for _, size, _ in objects)
+        now = time.time()
+        for mtime, size, fname in sorted(objects):
+            if total_size <= self.max_size:
+                break
+            if fname != keep and mtime < now - DownloadCache.EVICTION_GRACE_PERIOD:
+                _logger.debug(f"Evicting {cyan(fname)} from the download cache")
+                try:
+                    os.remove(fname)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+        # records of evicted files are ignored by lookup(), and get overwritten on the next download
+
+class GitMirrorCache:
+    # User-level cache of bare git repositories ("mirrors"), one per git_url, shared by all workspaces. Projects are
+    # cloned from the mirror, which is brought up to date with an incremental fetch first, so only new commits are
+    # transferred over the network. Cloning from a local path shares the object files via hardlinks where possible.
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(get_cache_directory(), "git")
+
+    def get_mirror_directory(self, git_url):
+        name = re.sub(r"\.git$", "", git_url.rstrip("/").rsplit("/", 1)[-1]) or "repo"
+        return os.path.join(self.directory, f"{name}-{hashlib.sha256(git_url.encode()).hexdigest()[:16]}.git")
+
+    def update(self, git_url, run_command, offline=False):
+        # creates or updates the mirror of the repository using the given function to run shell commands, and returns its directory
+        mirror_dir = self.get_mirror_directory(git_url)
+        if offline:
+            if not os.path.isdir(mirror_dir):
+                raise Exception(f"No mirror of {git_url} in {self.directory}, and network access is not allowed")
+            return mirror_dir
+        with file_lock(mirror_dir + ".lock"):
+            if not os.path.isdir(mirror_dir):
+                _logger.info(f"Creating mirror of {cyan(git_url)} in {cyan(mirror_dir)}")
+                temp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+                try:
+                    run_command(f"git clone --bare '{git_url}' '{temp_dir}/repo.git' && "
+                                f"git -C '{temp_dir}/repo.git' config remote.origin.fetch '+refs/heads/*:refs/heads/*'")
+                    os.rename(os.path.join(temp_dir, "repo.git"), mirror_dir)
+                finally:
+                    shutil.rmtree(temp_dir)
+            else:
+                _logger.info(f"Updating mirror of {cyan(git_url)} in {cyan(mirror_dir)}")
+                try:
+                    run_command(f"git -C '{mirror_dir}' fetch --prune --tags origin")
+                except Exception as e:
+                    _logger.warning(f"Could not update mirror of {cyan(git_url)}, using it as it is: {e}")
+        return mirror_dir
+
+    def create_bundle(self, git_url, bundle_file_name, run_command):
+        # writes all branches and tags of the mirror into a git bundle file
+        mirror_dir = self.get_mirror_directory(git_url)
+        with file_lock(mirror_dir + ".lock"):
+            run_command(f"git -C '{mirror_dir}' bundle create '{bundle_file_name}' --all")
+
+    def import_bundle(self, git_url, bundle_file_name, run_command):
+        # creates or updates the mirror of the repository from a git bundle file, without network access
+        mirror_dir = self.get_mirror_directory(git_url)
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(mirror_dir + ".lock"):
+            if not os.path.isdir(mirror_dir):
+                _logger.info(f"Creating mirror of {cyan(git_url)} in {cyan(mirror_dir)} from bundle")
+                temp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+                try:
+                    run_command(f"git clone --bare '{bundle_file_name}' '{temp_dir}/repo.git' && "
+                                f"git -C '{temp_dir}/repo.git' remote set-url origin '{git_url}' && "
+                                f"git -C '{temp_dir}/repo.git' config remote.origin.fetch '+refs/heads/*:refs/heads/*'")
+                    os.rename(os.path.join(temp_dir, "repo.git"), mirror_dir)
+                finally:
+                    shutil.rmtree(temp_dir)
+            else:
+                _logger.info(f"Updating mirror of {cyan(git_url)} in {cyan(mirror_dir)} from bundle")
+                run_command(f"git -C '{mirror_dir}' fetch '{bundle_file_name}' '+refs/heads/*:refs/heads/*' '+refs/tags/*:refs/tags/*'")
+
+class SourceTreeStore:
+    # User-level store of pristine source trees (e.g. unpacked release tarballs, keyed by the SHA-256 of the tarball),
+    # and of patched ones (keyed by a hash of the tarball, the patches and the environment, see get_patched_tree_key()),
+    # shared by all workspaces. Project directories are materialized from it as copies, which share the data blocks
+    # with the store ("reflinks") where the filesystem supports it (Btrfs, XFS, etc.), or as hardlinks if requested
+    # by setting $OPP_ENV_SOURCE_STORE to "hardlink". As plain copies would make the store cost as much disk space as
+    # the workspaces themselves, the store is only on by default if the filesystem of the cache directory supports
+    # reflinks; setting $OPP_ENV_SOURCE_STORE to "copy" turns it on regardless. Hardlinked files are shared with the store and all workspaces,
+    # so they are made read-only, and in-place writes fail (tools that replace files, like "sed -i", "git apply" and
+    # editors that save via rename, still work); trees that are going to be patched are always copied. Setting
+    # $OPP_ENV_SOURCE_STORE to "off" disables the store. Trees in the store are never modified (apart from the
+    # permissions); the total size is kept under a limit by evicting the least recently used ones.
+    MODES = ["copy", "hardlink", "off"]
+    DEFAULT_MAX_SIZE_MB = 20 * 1024  # can be overridden with $OPP_ENV_SOURCE_STORE_SIZE (in megabytes)
+    EVICTION_GRACE_PERIOD = 10 * 60  # trees used this recently (in seconds) are never evicted, as they may be being copied by another process
+    FICLONE = 0x40049409  # ioctl request from <linux/fs.h>
+    reflink_probe_results = {}  # { directory: bool }, so that the filesystem is only probed once per process
+
+    def __init__(self, directory=None, mode=None, max_size=None):
+        self.directory = directory or os.path.join(get_cache_directory(), "trees")
+        self.reflinks_supported = None  # unknown until probed, or until the first file is copied
+        self.mode = mode or os.environ.get("OPP_ENV_SOURCE_STORE") or ("copy" if self.probe_reflinks() else "off")
+        if self.mode not in SourceTreeStore.MODES:
+            raise Exception(f"Invalid $OPP_ENV_SOURCE_STORE value '{self.mode}', should be one of: {', '.join(SourceTreeStore.MODES)}")
+        self.max_size = max_size if max_size is not None else int(os.environ.get("OPP_ENV_SOURCE_STORE_SIZE") or SourceTreeStore.DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+
+    def probe_reflinks(self):
+        # whether the filesystem of the store supports reflinks, tried on a small file
+        if self.directory not in SourceTreeStore.reflink_probe_results:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with tempfile.TemporaryDirectory(dir=self.directory, prefix=".probe-") as temp_dir:
+                    with open(os.path.join(temp_dir, "src"), "wb") as f:
+                        f.write(b"probe")
+                    with open(os.path.join(temp_dir, "src"), "rb") as fsrc, open(os.path.join(temp_dir, "dst"), "wb") as fdst:
+                        fcntl.ioctl(fdst.fileno(), SourceTreeStore.FICLONE, fsrc.fileno())
+                SourceTreeStore.reflink_probe_results[self.directory] = True
+            except OSError as e:
+                _logger.debug(f"No reflink support in {cyan(self.directory)}, the source tree store is off unless $OPP_ENV_SOURCE_STORE is set: {e}")
+                SourceTreeStore.reflink_probe_results[self.directory] = False
+        self.reflinks_supported = SourceTreeStore.reflink_probe_results[self.directory]
+        return self.reflinks_supported
+
+    def is_enabled(self):
+        return self.mode != "off"
+
+    def get_tree_directory(self, key):
+        return os.path.join(self.directory, key)
+
+    def get_record_file_name(self, key):
+        # written after the tree is complete, so a tree without a record is incomplete
+        return os.path.join(self.directory, key + ".json")
+
+    def lookup(self, key):
+        # returns the directory of the tree with the given key, or None
+        record_file_name = self.get_record_file_name(key)
+        if not os.path.isfile(record_file_name):
+            return None
+        os.utime(record_file_name)  # mark as recently used
+        return self.get_tree_directory(key)
+
+    def add(self, key, populate):
+        # calls populate(dir) to create the tree with the given key as the (not yet existing) directory dir, unless it is already in the store; returns the tree directory
+        tree_dir = self.get_tree_directory(key)
+        with file_lock(tree_dir + ".lock"):
+            if self.lookup(key):
+                return tree_dir  # added by another process while we were waiting for the lock
+            os.makedirs(self.directory, exist_ok=True)
+            temp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+            try:
+                populate(os.path.join(temp_dir, "tree"))
+                size, num_files = self._measure_tree(os.path.join(temp_dir, "tree"))
+                if os.path.exists(tree_dir):
+                    shutil.rmtree(tree_dir)  # incomplete leftover (no record)
+                os.rename(os.path.join(temp_dir, "tree"), tree_dir)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            write_file_atomically(self.get_record_file_name(key), json.dumps({"size": size, "files": num_files}))
+        _logger.debug(f"Added {cyan(tree_dir)} to the source tree store ({num_files} files, {size/1024/1024:.1f} MiB)")
+        self.evict(keep=key)
+        return tree_dir
+
+    def add_directory(self, key, source_dir, keep_admin_files=[]):
+        # adds a copy of source_dir (never hardlinks, as it is a directory the user works in), without the project admin directory except the given files
+        def populate(tree_dir):
+            self._copy_tree(source_dir, tree_dir, hardlink=False)
+            admin_dir = os.path.join(tree_dir, Workspace.PROJECT_ADMIN_DIR)
+            if os.path.isdir(admin_dir):
+                for file_name in os.listdir(admin_dir):
+                    if file_name not in keep_admin_files:
+                        path = os.path.join(admin_dir, file_name)
+                        if os.path.isdir(path) and not os.path.islink(path):
+                            shutil.rmtree(path)
+                        else:
+                            os.remove(path)
+        return self.add(key, populate)
+
+    def materialize(self, key, target_dir, hardlink=None):
+        # creates target_dir as a copy of the tree, see the class comment; hardlink=False forces copying in hardlink mode
+        tree_dir = self.get_tree_directory(key)
+        if hardlink is None:
+            hardlink = self.mode == "hardlink"
+        _logger.debug(f"Materializing {cyan(tree_dir)} into {cyan(target_dir)} ({'hardlink' if hardlink else 'copy'})")
+        self._copy_tree(tree_dir, target_dir, hardlink)
+
+    def _copy_tree(self, src_dir, dst_dir, hardlink=None):
+        if hardlink is None:
+            hardlink = self.mode == "hardlink"
+        os.mkdir(dst_dir)
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                dst = os.path.join(dst_dir, entry.name)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), dst)
+                elif entry.is_dir():
+                    self._copy_tree(entry.path, dst, hardlink)
+                elif hardlink:
+                    mode = entry.stat().st_mode
+                    if mode & 0o222:
+                        os.chmod(entry.path, stat.S_IMODE(mode) & ~0o222)  # also affects the store's copy, as it is the same file
+                    os.link(entry.path, dst)
+                else:
+                    self._copy_file(entry.path, dst, entry.stat())
+        # directory attributes are set after the content, as the content could not be created in a read-only directory
+        st = os.stat(src_dir)
+        os.chmod(dst_dir, stat.S_IMODE(st.st_mode))
+        os.utime(dst_dir, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    def _copy_file(self, src, dst, st):
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            if self.reflinks_supported is not False:
+                try:
+                    fcntl.ioctl(fdst.fileno(), SourceTreeStore.FICLONE, fsrc.fileno())
+                    self.reflinks_supported = True
+                except OSError:
+                    self.reflinks_supported = False  # don't try again for every file
+            if not self.reflinks_supported:
+                shutil.copyfileobj(fsrc, fdst, 1024*1024)
+        os.chmod(dst, stat.S_IMODE(st.st_mode) | stat.S_IWUSR)  # files in the store may have been made read-only for hardlinking
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    def _measure_tree(self, dir):
+        size, num_files = 0, 0
+        for dirpath, dirnames, filenames in os.walk(dir):
+            for filename in filenames:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+                num_files += 1
+        return size, num_files
+
+    def evict(self, keep=None):
+        trees = []
+        for record_file_name in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(record_file_name) as f:
+                    trees.append((os.stat(record_file_name).st_mtime, json.load(f)["size"], os.path.basename(record_file_name)[:-len(".json")]))
+            except (FileNotFoundError, ValueError, KeyError):
+                pass  # removed concurrently, or being written
+        total_size = sum(size for _, size, _ in trees)
+        now = time.time()
+        for mtime, size, key in sorted(trees):
+            if total_size <= self.max_size:
+                break
+            if key != keep and mtime < now - SourceTreeStore.EVICTION_GRACE_PERIOD:
+                tree_dir = self.get_tree_directory(key)
+                _logger.debug(f"Evicting {cyan(tree_dir)} from the source tree store")
+                with file_lock(tree_dir + ".lock"):
+                    try:
+                        os.remove(self.get_record_file_name(key))
+                    except FileNotFoundError:
+                        continue
+                    shutil.rmtree(tree_dir, ignore_errors=True)
+                total_size -= size
+
+class SourceBundle:
+    # Single-file archive of project sources, for installing projects without network access ('opp_env bundle create',
+    # 'opp_env install --from-bundle'). It is an uncompressed ZIP file, as the content is mostly compressed already, so
+    # members can be read directly, without extracting the whole archive. The index.json member maps download URLs to
+    # members under downloads/ (named by the SHA-256 of the content), and git URLs to git bundles under git/.
+    INDEX_MEMBER = "index.json"
+    FORMAT_VERSION = 1
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        try:
+            self.zipfile = zipfile.ZipFile(file_name)
+            self.index = json.loads(self.zipfile.read(SourceBundle.INDEX_MEMBER))
+        except (zipfile.BadZipFile, KeyError, ValueError) as e:
+            raise Exception(f"{file_name} is not an opp_env bundle: {e}") from e
+        if self.index.get("format_version") != SourceBundle.FORMAT_VERSION:
+            raise Exception(f"{file_name}: unsupported bundle format version {self.index.get('format_version')}")
+
+    @staticmethod
+    def create(file_name, project_names, download_results, git_repository_results, run_command):
+        # the results are those of fetch_project_downloads(), i.e. the files are in the download cache and the git mirrors are up to date
+        index = { "format_version": SourceBundle.FORMAT_VERSION, "projects": project_names, "downloads": {}, "git_repositories": {} }
+        temp_file_name = file_name + ".tmp"
+        try:
+            with zipfile.ZipFile(temp_file_name, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as bundle:
+                for result in download_results:
+                    member = "downloads/" + result["sha256"]
+                    if member not in bundle.NameToInfo:  # the same content may be downloadable from several URLs
+                        bundle.write(result["file"], member)
+                    index["downloads"][result["url"]] = { "member": member, "sha256": result["sha256"] }
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    git_mirror_cache = GitMirrorCache()
+                    for result in git_repository_results:
+                        member = "git/" + os.path.basename(result["mirror"]) + ".bundle"
+                        bundle_file_name = os.path.join(temp_dir, "repo.bundle")
+                        git_mirror_cache.create_bundle(result["url"], bundle_file_name, run_command)
+                        bundle.write(bundle_file_name, member)
+                        os.remove(bundle_file_name)
+                        index["git_repositories"][result["url"]] = { "member": member }
+                bundle.writestr(SourceBundle.INDEX_MEMBER, json.dumps(index, indent=4))
+            os.replace(temp_file_name, file_name)
+        except BaseException:
+            if os.path.exists(temp_file_name):
+                os.remove(temp_file_name)
+            raise
+
+    def import_download(self, url, download_cache):
+        # adds the file downloaded from the URL to the download cache, unless it is already there; returns False if not in the bundle
+        entry = self.index["downloads"].get(url)
+        if not entry:
+            return False
+        fname = download_cache.lookup(url)
+        if not fname or os.path.basename(fname) != entry["sha256"]:
+            with self.zipfile.open(entry["member"]) as f:
+                fname = download_cache.store(url, f, entry["sha256"])
+            download_cache.evict(keep=fname)
+        return True
+
+    def import_git_repository(self, git_url, git_mirror_cache, run_command):
+        # creates or updates the mirror of the git repository; returns False if not in the bundle
+        entry = self.index["git_repositories"].get(git_url)
+        if not entry:
+            return False
+        # git needs the bundle as a file of its own
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_file_name = os.path.join(temp_dir, "repo.bundle")
+            with self.zipfile.open(entry["member"]) as src, open(bundle_file_name, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024*1024)
+            git_mirror_cache.import_bundle(git_url, bundle_file_name, run_command)
+        return True
+
+_project_registry = None
+
+def get_project_registry():
+    # the registry is created on first access, so that subcommands that don't need
+    # the project database (init, --version, -h, etc.) don't pay for loading it
+    global _project_registry
+    if _project_registry is None:
+        _project_registry = ProjectRegistry()
+    return _project_registry
+
 def activate_project_options(project_descriptions, requested_options):
     # check requested options exist at all
     all_supported_options = []
@@ -746,6 +2370,10 @@ class Workspace:
     WORKSPACE_ADMIN_DIR = ".opp_env_workspace"
     PROJECT_ADMIN_DIR = ".opp_env"
 
+    MAX_PARALLEL_DOWNLOADS = 4
+
+    GIT_CLONE_STRATEGIES = ["full", "shallow", "partial"]
+
     def __init__(self, root_directory, default_nixos=None, default_stdenv=None):
         assert(os.path.isabs(root_directory))
         self.root_directory = root_directory
@@ -756,11 +2384,13 @@ class Workspace:
         if not os.path.exists(opp_env_directory):
             raise Exception(f"'{root_directory}' is not an opp_env workspace, run 'opp_env init' to turn it into one")
         self.nixless = os.path.exists(os.path.join(self.get_workspace_admin_directory(), ".nixless"))  #TODO do it properly!!!
+        self.settings = Workspace.read_settings(opp_env_directory)
 
+        tools_cache_file_name = os.path.join(self.get_workspace_admin_directory(), "tools.json")
         if self.nixless:
-            detect_tools()
+            detect_tools(tools_cache_file_name)
         else:
-            detect_nix()
+            detect_nix(tools_cache_file_name)
 
         _logger.debug(f"Workspace {root_directory=}, {self.nixless=}")
 
@@ -782,7 +2412,7 @@ class Workspace:
         #return None
 
     @staticmethod
-    def init_workspace(dir=None, allow_existing=False, nixless=False):
+    def init_workspace(dir=None, allow_existing=False, nixless=False, git_clone=None):
         if not dir:
             dir = os.getcwd()
         if not os.path.isdir(dir):
@@ -800,18 +2430,36 @@ class Workspace:
         if nixless:
             # write an empty file called .nixless to indicate that this is a nixless workspace
             open(os.path.join(opp_env_dir, ".nixless"), "w").close()
+        if git_clone:
+            Workspace.write_settings(opp_env_dir, {"git_clone": git_clone})
         _logger.info(f"Workspace created in folder {cyan(dir)}")
 
+    @staticmethod
+    def read_settings(opp_env_dir):
+        # workspace-level defaults, e.g. {"git_clone": "shallow"}
+        settings_file_name = os.path.join(opp_env_dir, "settings.json")
+        if not os.path.isfile(settings_file_name):
+            return {}
+        with open(settings_file_name) as f:
+            return json.load(f)
+
+    @staticmethod
+    def write_settings(opp_env_dir, settings):
+        with open(os.path.join(opp_env_dir, "settings.json"), "w") as f:
+            json.dump(settings, f, indent=4)
+
     def get_workspace_admin_directory(self):
         return os.path.join(self.root_directory, self.WORKSPACE_ADMIN_DIR)
 
+    def get_resolution_cache(self):
+        return ResolutionCache(os.path.join(self.get_workspace_admin_directory(), "resolutions.json"))
+
     def get_installed_projects(self):
         def is_project(folder_name):
             return os.path.isdir(os.path.join(self.root_directory, folder_name, self.PROJECT_ADMIN_DIR))
         def get_project_description(folder_name):
             try:
-                global project_registry
-                return project_registry.get_project_description(folder_name)
+                return get_project_registry().get_project_description(folder_name)
             except Exception as e:
                 _logger.warning(f"Failed to load project description for '{folder_name}': {e}")
                 return None
@@ -861,7 +2509,16 @@ class Workspace:
         data.update(kwargs)
         self.write_project_state_file(project_description, data)
 
-    def download_project(self, project_description, effective_project_descriptions, patch=True, cleanup=True, local=False, **kwargs):
+    def download_project(self, project_description, effective_project_descriptions, patch=True, cleanup=True, **kwargs):
+        self.download_projects([project_description], effective_project_descriptions, patch, cleanup, **kwargs)
+
+    def download_projects(self, project_descriptions, effective_project_descriptions, patch=True, cleanup=True, local=False, git_clone=None, offline=False, git_mirrors_updated=False, **kwargs):
+        # Downloads and patches the given projects, in order. The steps done in-process (tarballs, git clones, patch files,
+        # patch operations) go project by project, but the download_commands of all projects, and then their patch_commands,
+        # are each run in one Nix session (see run_project_commands()), because entering one takes seconds. If a step fails
+        # for a project, that project and the ones the step has not reached yet are dropped (and removed at the end), the
+        # others are set up completely, then the error is raised. An interrupt drops all projects not completed yet.
+        # git_mirrors_updated=True means that the git mirrors have just been updated (see prefetch_downloads()).
         def get_env(varname, what):
             value = os.environ.get(varname)
             _logger.debug(f"Checking {cyan('$'+varname)} for {what}: {cyan(value)}")
@@ -869,68 +2526,246 @@ class Workspace:
                 raise Exception(f"Environment variable {varname} not set, it should point to {what}")
             return value
 
-        _logger.info(f"Downloading project {cyan(project_description.get_full_name())} in workspace {cyan(self.root_directory)}")
-        project_dir = self.get_project_root_directory(project_description)
-        if os.path.exists(project_dir):
-            raise Exception(f"{project_dir} already exists")
-        try:
+        for project_description in project_descriptions:
+            project_dir = self.get_project_root_directory(project_description)
+            if os.path.exists(project_dir):
+                raise Exception(f"{project_dir} already exists")
+
+        git_clone = git_clone or self.settings.get("git_clone") or "full"
+        source_tree_store = SourceTreeStore()
+        patched_tree_project_descriptions = []  # the projects whose patched tree is to be added to the store
+        pending_project_descriptions = []  # projects being set up
+        failed_project_descriptions = []  # projects to be removed
+        error = None  # the first error
+        local_operation_command = f"export LOCAL_OPERATION={'1' if local else ''}"
+
+        def drop(project_descriptions, e):
+            # drop the given projects (the failing one and those not processed yet) from the pending ones
+            nonlocal error
+            error = error or e
+            for project_description in project_descriptions:
+                if project_description in pending_project_descriptions:
+                    pending_project_descriptions.remove(project_description)
+                failed_project_descriptions.append(project_description)
+
+        def for_each_pending(step):
+            # runs step() on each pending project until one of them fails
+            for project_description in list(pending_project_descriptions):
+                try:
+                    step(project_description)
+                except Exception as e:
+                    drop(pending_project_descriptions[pending_project_descriptions.index(project_description):], e)
+                    break
+
+        def run_pending_project_commands(step, get_working_directory, get_commands):
+            project_commands = [(p, get_working_directory(p), [local_operation_command, *get_commands(p)]) for p in pending_project_descriptions if get_commands(p)]
+            completed_project_descriptions = []
+            try:
+                self.run_project_commands(step, project_commands, effective_project_descriptions, completed_project_descriptions=completed_project_descriptions, **kwargs)
+            except Exception as e:
+                drop([p for p, _, _ in project_commands if p not in completed_project_descriptions], e)
+
+        def fetch(project_description):
+            _logger.info(f"Downloading project {cyan(project_description.get_full_name())} in workspace {cyan(self.root_directory)}")
+            project_dir = self.get_project_root_directory(project_description)
+            if patch and Workspace.has_patches(project_description) and project_description.download_url and not local and source_tree_store.is_enabled():
+                patched_tree_key = self.get_patched_tree_key(project_description, effective_project_descriptions, download=False)
+                if patched_tree_key and source_tree_store.lookup(patched_tree_key):
+                    # the stored tree also contains the postdownload shasums
+                    _logger.info(f"Restoring patched source tree of project {cyan(project_description.get_full_name())} from the source tree store")
+                    source_tree_store.materialize(patched_tree_key, project_dir)
+                    self.update_project_state(project_description, name=project_description.get_full_name())
+                    pending_project_descriptions.remove(project_description)
+                    return
+                patched_tree_project_descriptions.append(project_description)
             if project_description.download_commands:
-                commands = [ f"export LOCAL_OPERATION={'1' if local else ''}", *project_description.download_commands ]
-                self.nix_develop(effective_project_descriptions, self.root_directory, commands, run_setenv=False, **kwargs)
+                pass  # see below
             elif project_description.download_url:
                 if not local:
-                    self.download_and_unpack_tarball(project_description.download_url, project_dir)
+                    # a tree to be patched is copied, as the patch commands may modify files in place
+                    self.download_and_materialize_tarball(project_description.download_url, project_dir, project_description.download_sha256, hardlink=False if patch and Workspace.has_patches(project_description) else None)
                 else:
                     downloads_dir = get_env("DOWNLOADS_DIR", "the downloads directory on the local disk")
-                    fname = os.path.basename(project_description.download_url)
-                    if project_description.name.lower() not in fname.lower():  # e.g. just "v1.2.0.tar.gz"
-                        fname = project_description.name() + "-" + fname
-                    tarball = os.path.join(downloads_dir, fname)
-                    self.unpack_tarball(tarball, project_dir)
+                    tarball = os.path.join(downloads_dir, Workspace.get_local_download_file_name(project_description.name, project_description.download_url))
+                    self.unpack_tarball(tarball, project_dir, project_description.download_sha256)
             elif project_description.git_url:
-                if not local:
+                branch_option = "-b " + project_description.git_branch if project_description.git_branch else ""
+                project_git_clone = git_clone
+                if local:
+                    git_url = get_env(project_description.name.upper() + "_REPO", f"the location of the '{project_description.name}' git repository on the local disk")
+                    project_git_clone = "full"
+                    self.run_command(f"git clone --config advice.detachedHead=false {branch_option} {git_url} {project_dir}")
+                elif git_clone == "full" or offline:
+                    # clone from the user-level mirror, then point "origin" to the real remote
                     git_url = project_description.git_url
+                    project_git_clone = "full"
+                    mirror_dir = GitMirrorCache().update(git_url, self.run_command, offline=offline or git_mirrors_updated)
+                    self.run_command(f"git clone --config advice.detachedHead=false {branch_option} '{mirror_dir}' {project_dir} && git -C {project_dir} remote set-url origin {git_url}")
                 else:
-                    git_url = get_env(project_description.name.upper() + "_REPO", f"the location of the '{project_description.name}' git repository on the local disk")
-                branch_option = "-b " + project_description.git_branch if project_description.git_branch else ""
-                self.run_command(f"git clone --config advice.detachedHead=false {branch_option} {git_url} {project_dir}") #TODO maybe optionally use --single-branch
+                    # clone directly from the remote, as the point is to transfer less than the full repository
+                    clone_options = "--single-branch --depth 1" if git_clone == "shallow" else "--filter=blob:none"
+                    self.run_command(f"git clone --config advice.detachedHead=false {clone_options} {branch_option} {project_description.git_url} {project_dir}")
+                self.update_project_state(project_description, git_clone=project_git_clone)
             else:
                 raise Exception(f"{project_description}: No download_url or download_commands in project description -- check project options for alternative download means (enter 'opp_env info {project_description}')")
-            if not os.path.exists(project_dir):
-                raise Exception(f"{project_description}: Download process did not create {project_dir}")
 
-            if project_description.patch_commands or project_description.patch_url:
+        def check_downloaded(project_description):
+            if not os.path.exists(self.get_project_root_directory(project_description)):
+                raise Exception(f"{project_description}: Download process did not create {self.get_project_root_directory(project_description)}")
+
+        def apply_patches(project_description):
+            project_dir = self.get_project_root_directory(project_description)
+            if Workspace.has_patches(project_description):
                 if patch:
                     _logger.info(f"Patching project {cyan(project_description.get_full_name())}")
+                    revalidate = not offline
+                    if project_description.patch_downloads and not local:
+                        self.download_patch_files(project_description.patch_downloads, project_dir, revalidate=revalidate)
                     if project_description.patch_url:
-                        self.download_and_apply_patch(project_description.patch_url, project_dir)
-                    if project_description.patch_commands:
-                        commands = [ f"export LOCAL_OPERATION={'1' if local else ''}", *project_description.patch_commands ]
-                        self.nix_develop(effective_project_descriptions, project_dir, commands, run_setenv=False, **kwargs)
+                        self.download_and_apply_patch(project_description.patch_url, project_dir, revalidate=revalidate)
+                    if project_description.patch_operations:
+                        PatchOperations(project_description.patch_operations).apply(project_dir)
                 else:
                     _logger.info(f"Skipping patching step of project {cyan(project_description.get_full_name())}")
 
+        def finish(project_description):
             self.update_project_state(project_description, name=project_description.get_full_name())
             self.record_project_shasums(project_description, "postdownload")
-        except KeyboardInterrupt as e:
+            if project_description in patched_tree_project_descriptions:
+                # the key is computed again, as revalidating the patch files may have downloaded new versions of them
+                source_tree_store.add_directory(self.get_patched_tree_key(project_description, effective_project_descriptions), self.get_project_root_directory(project_description), keep_admin_files=["postdownload.sha"])
+            pending_project_descriptions.remove(project_description)
+
+        try:
+            pending_project_descriptions.extend(project_descriptions)
+            for_each_pending(fetch)
+            run_pending_project_commands("download", lambda p: self.root_directory, lambda p: p.download_commands)
+            for_each_pending(check_downloaded)
+            for_each_pending(apply_patches)
+            if patch:
+                run_pending_project_commands("patch", self.get_project_root_directory, lambda p: p.patch_commands)
+            for_each_pending(finish)
+        except BaseException as e:
+            drop(list(pending_project_descriptions), e)
+        if failed_project_descriptions:
             if cleanup:
-                _logger.info("Download interrupted by user, cleaning up")
-                if os.path.isdir(project_dir):
-                    shutil.rmtree(project_dir)
-            raise e
+                _logger.info("Download interrupted by user, cleaning up" if isinstance(error, KeyboardInterrupt) else "Error during download, cleaning up")
+                for project_description in failed_project_descriptions:
+                    project_dir = self.get_project_root_directory(project_description)
+                    if os.path.isdir(project_dir):
+                        shutil.rmtree(project_dir)
+            raise error
+
+    def run_project_commands(self, step, project_commands, effective_project_descriptions, completed_project_descriptions=None, **kwargs):
+        # Runs the commands of several projects, given as (project description, working directory, commands) tuples, in
+        # one Nix session. The commands of each project run in a subshell, so that directory changes etc. do not affect
+        # the next project, and a marker file is created after each project's commands succeeded, to tell which project
+        # the failure belongs to. The projects whose commands succeeded are appended to completed_project_descriptions
+        # (if given), also when the commands of a later project fail.
+        if not project_commands:
+            return
+        marker_dir = tempfile.mkdtemp(dir=self.get_workspace_admin_directory(), prefix=f".{step}-")
+        def get_marker_file_name(i):
+            return os.path.join(marker_dir, str(i))
+        script = []
+        for i, (project_description, working_directory, commands) in enumerate(project_commands):
+            script += [f"echo {shlex.quote(f'Running {step} commands of {project_description.get_full_name()}')}",
+                       "(", f"cd '{working_directory}'", *commands, ")",
+                       f"touch '{get_marker_file_name(i)}'"]
+        try:
+            self.nix_develop(effective_project_descriptions, self.root_directory, script, run_setenv=False, **kwargs)
         except Exception as e:
-            if cleanup:
-                _logger.info("Error during download, cleaning up")
-                if os.path.isdir(project_dir):
-                    shutil.rmtree(project_dir)
-            raise e
+            failed_project_description = next((p for i, (p, _, _) in enumerate(project_commands) if not os.path.exists(get_marker_file_name(i))), None)
+            if failed_project_description is None:
+                raise e
+            raise Exception(f"{failed_project_description}: The {step} commands failed: {e}") from e
+        finally:
+            if completed_project_descriptions is not None:
+                completed_project_descriptions.extend(p for i, (p, _, _) in enumerate(project_commands) if os.path.exists(get_marker_file_name(i)))
+            shutil.rmtree(marker_dir, ignore_errors=True)
+
+    @staticmethod
+    def has_patches(project_description):
+        return project_description.patch_commands or project_description.patch_url or project_description.patch_downloads or project_description.patch_operations
+
+    def get_patched_tree_key(self, project_description, effective_project_descriptions, download=True):
+        # key of the patched source tree in the source tree store: a hash of everything the result of patching depends on,
+        # i.e. the content of the tarball and the patch files, the patch commands (after activating the project options),
+        # and the environment they run in. The content hashes are taken from download_sha256 or the download cache's URL
+        # records (which are kept when the files are evicted), so a project that has been installed before needs neither
+        # its downloads nor network access; the files are only downloaded if they never have been (with download=False,
+        # None is returned instead).
+        download_cache = DownloadCache()
+        def content_hash(url, sha256=None):
+            if sha256:
+                return sha256.lower()
+            return download_cache.lookup_hash(url) or (os.path.basename(download_cache.fetch(url)) if download else None)
+        nixful = not self.nixless
+        download_hashes = {
+            "download": content_hash(project_description.download_url, project_description.download_sha256),
+            "patch_url": content_hash(project_description.patch_url) if project_description.patch_url else None,
+            "patch_downloads": { file_name: content_hash(url) for file_name, url in project_description.patch_downloads.items() },
+        }
+        if None in [download_hashes["download"], *download_hashes["patch_downloads"].values()] or (project_description.patch_url and not download_hashes["patch_url"]):
+            return None  # some file has never been downloaded
+        fingerprint = {
+            **download_hashes,
+            "patch_operations": list(project_description.patch_operations),
+            "patch_commands": list(project_description.patch_commands),
+            "nixos": Workspace._get_unique_project_attribute(effective_project_descriptions, "nixos", self.default_nixos) if nixful else None,
+            "stdenv": Workspace._get_unique_project_attribute(effective_project_descriptions, "stdenv", self.default_stdenv) if nixful else None,
+            "nix_packages": sorted(set(package for p in effective_project_descriptions for package in p.nix_packages)) if nixful else None,
+        }
+        _logger.debug(f"Patched source tree fingerprint of {cyan(project_description.get_full_name())}: {fingerprint}")
+        return "patched-" + hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+    def is_patched_tree_stored(self, project_description, effective_project_descriptions):
+        # whether the project can be restored from the source tree store, without downloading and patching it
+        source_tree_store = SourceTreeStore()
+        if not source_tree_store.is_enabled() or not project_description.download_url or not Workspace.has_patches(project_description):
+            return False
+        patched_tree_key = self.get_patched_tree_key(project_description, effective_project_descriptions, download=False)
+        return patched_tree_key is not None and source_tree_store.lookup(patched_tree_key) is not None
+
+    @staticmethod
+    def get_local_download_file_name(project_name, download_url):
+        # name of the file in $DOWNLOADS_DIR that is used instead of download_url in local mode
+        fname = os.path.basename(download_url)
+        if project_name.lower() not in fname.lower():  # e.g. just "v1.2.0.tar.gz"
+            fname = project_name + "-" + fname
+        return fname
 
     def record_project_shasums(self, project_description, snapshot_name):
-        # exclude the Simulation IDE's directory from the shasum, because ./configure and eclipse itself modifies stuff in it
+        # exclude the Simulation IDE's directory from the shasum, because ./configure and eclipse itself modifies stuff in it;
+        # also exclude .git of shallow and partial clones, because git operations regularly fetch objects into them
         project_root = self.get_project_root_directory(project_description)
         shasum_file = self.get_project_admin_file(project_description, snapshot_name+".sha", create_dir=True)
-        # note: we chdir into project_root so that the shasum file will contain project-relative paths not absolute ones
-        self.run_command(f"cd {project_root} && find . \\( -path ./{self.PROJECT_ADMIN_DIR} -o -path ./ide \\) -prune -o -type f -print0 | xargs -0 shasum > {shasum_file}")
+        git_clone = self.read_project_state_file(project_description).get("git_clone", "full")
+        excluded_paths = [f"./{dir}" for dir in [self.PROJECT_ADMIN_DIR, "ide", *([".git"] if git_clone != "full" else [])]]
+        # computed in-process (instead of "find | xargs shasum", which would mean entering a Nix session), in the same format
+        # as shasum's output with project-relative paths, as the check_* shell functions verify it with "shasum --check"
+        lines = []
+        def walk(dir, prefix):
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    path = prefix + entry.name
+                    if entry.is_symlink():
+                        continue
+                    elif entry.is_dir():
+                        if path not in excluded_paths:
+                            walk(entry.path, path + "/")
+                    elif entry.is_file():
+                        hash = hashlib.sha1()
+                        with open(entry.path, "rb") as f:
+                            while chunk := f.read(1024*1024):
+                                hash.update(chunk)
+                        if "\\" in path or "\n" in path:
+                            lines.append("\\" + hash.hexdigest() + "  " + path.replace("\\", "\\\\").replace("\n", "\\n"))  # escaped like shasum does
+                        else:
+                            lines.append(hash.hexdigest() + "  " + path)
+        walk(project_root, "./")
+        with open(shasum_file, "w", errors="surrogateescape") as f:
+            f.write("".join([line + "\n" for line in lines]))
 
     def read_project_shasums(self, project_description, snapshot_name, allow_missing=False):
         shasum_file = self.get_project_admin_file(project_description, snapshot_name+".sha")
@@ -995,6 +2830,73 @@ class Workspace:
         else:
             return list(values)[0]
 
+    def download_projects_if_needed(self, effective_project_descriptions, local=False, bundle=None, **kwargs):
+        # fetch the downloads and git repositories of all absent projects concurrently (or take them from the bundle), check the present ones, then set up the absent ones together (see download_projects())
+        git_mirrors_updated = False
+        absent_project_descriptions = [p for p in effective_project_descriptions if self.get_project_status(p) == Workspace.ABSENT]
+        if bundle:
+            if local:
+                raise Exception("Installing from a bundle and local mode are mutually exclusive")
+            self.import_downloads_from_bundle(bundle, absent_project_descriptions)
+        elif not local:
+            # the projects whose patched tree is in the source tree store need no downloads
+            patch = kwargs.get("patch", True)
+            git_mirrors_updated = self.prefetch_downloads([p for p in absent_project_descriptions if not (patch and self.is_patched_tree_stored(p, effective_project_descriptions))], kwargs.get("git_clone"))
+        for project_description in effective_project_descriptions:
+            if project_description not in absent_project_descriptions:
+                self.download_project_if_needed(project_description, effective_project_descriptions, local=local, offline=bool(bundle), **kwargs)
+        if absent_project_descriptions:
+            self.download_projects(absent_project_descriptions, effective_project_descriptions, local=local, offline=bool(bundle), git_mirrors_updated=git_mirrors_updated, **kwargs)
+            for project_description in absent_project_descriptions:
+                assert self.get_project_status(project_description) == Workspace.DOWNLOADED, f"Wrong project status {self.get_project_status(project_description)} after download"
+
+    def import_downloads_from_bundle(self, bundle, project_descriptions):
+        # adds the files and git repositories needed by the given projects from the bundle to the download cache and the git mirrors
+        unsupported = [p for p in project_descriptions if p.download_commands]
+        if unsupported:
+            raise Exception(f"Cannot install the following project(s) from a bundle, because they are downloaded with custom commands (download_commands): {', '.join([str(p) for p in unsupported])}")
+        download_cache = DownloadCache()
+        git_mirror_cache = GitMirrorCache()
+        missing = []
+        for p in project_descriptions:
+            for url in [p.download_url, p.patch_url, *p.patch_downloads.values()]:
+                if url and not bundle.import_download(url, download_cache):
+                    missing.append(f"{p}: {url}")
+            if p.git_url and not bundle.import_git_repository(p.git_url, git_mirror_cache, self.run_command):
+                missing.append(f"{p}: {p.git_url}")
+        if missing:
+            raise Exception(f"Bundle {bundle.file_name} does not contain the following item(s):\n" + "\n".join(["  " + item for item in missing]))
+
+    def prefetch_downloads(self, project_descriptions, git_clone=None):
+        # download the tarballs of the given projects into the download cache, and update the git mirrors of the ones
+        # that are cloned from a mirror (see GitMirrorCache), using several threads; returns whether there were git mirrors
+        git_clone = git_clone or self.settings.get("git_clone") or "full"
+        download_urls = uniq([p.download_url for p in project_descriptions if p.download_url])
+        git_urls = uniq([p.git_url for p in project_descriptions if p.git_url]) if git_clone == "full" else []
+        urls = git_urls + download_urls  # git repositories first, as they typically take the longest
+        if not urls:
+            return False
+        download_sha256s = { p.download_url: p.download_sha256 for p in project_descriptions if p.download_url }
+        download_cache = DownloadCache()
+        git_mirror_cache = GitMirrorCache()
+        # git is run on the host if available (always the case in nixless workspaces), as entering a Nix session for it takes seconds
+        run_command = run_host_command if self.nixless or shutil.which("git") else self.run_command
+        def fetch(url):
+            try:
+                if url in git_urls:
+                    git_mirror_cache.update(url, run_command)
+                else:
+                    download_cache.fetch(url, sha256=download_sha256s[url])
+            except Exception as e:
+                return e
+        _logger.debug(f"Prefetching {len(download_urls)} download(s) and {len(git_urls)} git repositories with up to {self.MAX_PARALLEL_DOWNLOADS} threads")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(urls), self.MAX_PARALLEL_DOWNLOADS)) as executor:
+            errors = dict(zip(urls, executor.map(fetch, urls)))
+        failed = [(p, url) for p in project_descriptions for url in [p.download_url or p.git_url] if errors.get(url)]
+        if failed:
+            raise Exception(f"Download failed for {len(failed)} project(s):\n" + "\n".join([f"  {p}: {errors[url]}" for p, url in failed]))
+        return bool(git_urls)
+
     def download_project_if_needed(self, project_description, effective_project_descriptions, patch=True, cleanup=True, **kwargs):
         project_state = self.get_project_status(project_description)
         if project_state == Workspace.ABSENT:
@@ -1019,47 +2921,66 @@ class Workspace:
         except:
             return ""
 
-    def download_and_unpack_tarball(self, download_url, target_folder):
+    def download_and_unpack_tarball(self, download_url, target_folder, sha256=None):
+        # How a tarball gets into a project directory, without entering a Nix session: DownloadCache.fetch() downloads
+        # it into a partial file in the download cache (resuming an interrupted download with a Range request, and
+        # verifying download_sha256 if known), then stores it under its content hash. The cached file is then read
+        # through a HashingReader (to detect a corrupted cache entry) and extracted by extract_tarball(): it detects
+        # the compression format, decompresses in parallel with the extraction (with pigz etc. if installed, see
+        # open_decompressed()), and feeds the stream to the tar program if installed, otherwise to tarfile.
+        self._extract_tarball(target_folder, lambda extract: DownloadCache().fetch(download_url, extract, sha256))
+
+    def download_and_materialize_tarball(self, download_url, target_folder, sha256=None, hardlink=None):
+        # like download_and_unpack_tarball(), but via the source tree store, where the tree is only unpacked once per tarball content;
+        # hardlink=False makes a copy even in hardlink mode (see SourceTreeStore.materialize())
+        source_tree_store = SourceTreeStore()
+        if not source_tree_store.is_enabled():
+            return self.download_and_unpack_tarball(download_url, target_folder, sha256)
+        download_cache = DownloadCache()
+        tarball_sha256 = os.path.basename(download_cache.fetch(download_url, sha256=sha256))
+        if not source_tree_store.lookup(tarball_sha256):
+            source_tree_store.add(tarball_sha256, lambda tree_dir: self._extract_tarball(tree_dir, lambda extract: download_cache.fetch(download_url, extract, tarball_sha256)))
+        source_tree_store.materialize(tarball_sha256, target_folder, hardlink)
+
+    def unpack_tarball(self, tarball_fname, target_folder, sha256=None):
+        def extract_file(extract):
+            with open(tarball_fname, "rb") as f:
+                reader = HashingReader(f)
+                extract(reader)
+                reader.read_to_end()
+            reader.verify(sha256, tarball_fname)
+        self._extract_tarball(target_folder, extract_file)
+
+    def _extract_tarball(self, target_folder, feed):
+        # feed() is called with a function that extracts a tarball from a file object into target_folder;
+        # errors are also written into tar.log in target_folder, which is only removed on success
         os.makedirs(target_folder)
         tar_log_file = os.path.join(target_folder, "tar.log")
         try:
-            print(f"{download_url}")
-            self.run_command(f"cd {target_folder} && curl -L --fail --progress-bar {download_url} | tar --strip-components=1 -xzf - 2>{tar_log_file}")
-            os.remove(tar_log_file)
+            feed(lambda fileobj: extract_tarball(fileobj, target_folder))
         except Exception as e:
+            with open(tar_log_file, "w") as f:
+                f.write(f"tar: {e}\n")
             print(self._read_file_if_exists(tar_log_file).strip())
             raise e
 
-    def unpack_tarball(self, tarball_fname, target_folder):
-        os.makedirs(target_folder)
-        self.run_command(f"cd {target_folder} && tar --strip-components=1 -xzf {tarball_fname}")
-
-    def download_and_apply_patch(self, patch_url, target_folder):
-        curl_log_file = os.path.join(target_folder, "curl.log")
+    def download_and_apply_patch(self, patch_url, target_folder, revalidate=True):
+        # patches may be generated from branches (e.g. GitHub compare URLs), so the cached copy is revalidated
+        patch_file_name = DownloadCache().fetch(patch_url, revalidate=revalidate)
         patching_log_file = os.path.join(target_folder, "patch.log")
         try:
-            self.run_command(f"cd {target_folder} && curl -L --fail --stderr {curl_log_file} {patch_url} | git apply --whitespace=nowarn - 2>{patching_log_file}")
-            os.remove(curl_log_file)
+            self.run_command(f"cd {target_folder} && git apply --whitespace=nowarn {patch_file_name} 2>{patching_log_file}")
             os.remove(patching_log_file)
         except Exception as e:
-            print(self._read_file_if_exists(curl_log_file).strip())
             print(self._read_file_if_exists(patching_log_file).strip())
             raise e
 
-    @staticmethod
-    def _get_dependencies(project_description, effective_project_descriptions):
-        # find dependencies of the project among effective_projects
-        todo = [project_description]
-        processed = set()
-        deps = []
-        while todo:
-            project = todo.pop()
-            if project not in processed:
-                new_deps = [p for p in effective_project_descriptions if p.name in project.required_projects and p not in processed]
-                deps += new_deps
-                processed.add(project)
-                todo.extend(new_deps)
-        return deps
+    def download_patch_files(self, patch_downloads, target_folder, revalidate=True):
+        # files needed by the patch commands, e.g. diffs between releases; they are revalidated for the same reason as in download_and_apply_patch()
+        download_cache = DownloadCache()
+        for file_name, url in patch_downloads.items():
+            _logger.debug(f"Downloading {cyan(url)} as {cyan(file_name)}")
+            shutil.copyfile(download_cache.fetch(url, revalidate=revalidate), os.path.join(target_folder, file_name))
 
     def _define_shell_functions(self, effective_project_descriptions):
         def make_build_function(function_name, directory, build_commands):
@@ -1172,9 +3093,9 @@ class Workspace:
             stdenv = Workspace._get_unique_project_attribute(effective_project_descriptions, "stdenv", self.default_stdenv)
 
         session_name = '+'.join([str(d) for d in reversed(effective_project_descriptions)])
-        project_shell_hook_commands = sum([p.shell_hook_commands for p in effective_project_descriptions if p.shell_hook_commands], [])
-        project_nix_packages = sum([p.nix_packages for p in effective_project_descriptions], [])
-        project_vars_to_keep = sum([p.vars_to_keep for p in effective_project_descriptions], [])
+        project_shell_hook_commands = [cmd for p in effective_project_descriptions for cmd in p.shell_hook_commands]
+        project_nix_packages = [pkg for p in effective_project_descriptions for pkg in p.nix_packages]
+        project_vars_to_keep = [var for p in effective_project_descriptions for var in p.vars_to_keep]
         project_setenv_commands = sum([[f"cd '{self.get_project_root_directory(p)}'", *p.setenv_commands] for p in reversed(effective_project_descriptions)], [])
         project_root_environment_variable_assignments = [f"export {p.name.upper()}_ROOT={self.get_project_root_directory(p)}" for p in effective_project_descriptions]
         project_version_environment_variable_assignments = [f"export {p.name.upper()}_VERSION=\"{p.version}\"" for p in effective_project_descriptions]
@@ -1330,11 +3251,11 @@ class Workspace:
         return result
 
 def resolve_projects(project_full_names, remove_trailing_slash=True):
-    global project_registry
+    project_registry = get_project_registry()
     project_descriptions = [project_registry.get_project_description(ProjectReference.parse(p.rstrip('/') if remove_trailing_slash else p)) for p in project_full_names]
     return project_descriptions
 
-def init_workspace(workspace_directory, force=False, allow_existing=False, nixless=False):
+def init_workspace(workspace_directory, force=False, allow_existing=False, nixless=False, git_clone=None):
     workspace_directory = workspace_directory or os.getcwd()
     if os.path.isdir(workspace_directory):
         if not Workspace.is_workspace(workspace_directory):
@@ -1345,7 +3266,7 @@ def init_workspace(workspace_directory, force=False, allow_existing=False, nixle
         if not os.path.isdir(parent_dir):
             raise Exception(f"Cannot create workspace at '{workspace_directory}': refusing to create more than one level of directories")
         os.mkdir(workspace_directory)
-    Workspace.init_workspace(workspace_directory, allow_existing=allow_existing, nixless=nixless)
+    Workspace.init_workspace(workspace_directory, allow_existing=allow_existing, nixless=nixless, git_clone=git_clone)
     return workspace_directory
 
 def resolve_workspace(workspace_directory, init, nixless_workspace):
@@ -1359,11 +3280,11 @@ def resolve_workspace(workspace_directory, init, nixless_workspace):
         workspace = Workspace(workspace_directory)
     return workspace
 
-def check_project_dependencies(effective_project_descriptions, workspace, pause_after_warnings=True):
-    for project_description in effective_project_descriptions:
+def check_project_dependencies(dependency_graph, workspace, pause_after_warnings=True):
+    for project_description in dependency_graph.project_descriptions:
         data = workspace.read_project_state_file(project_description)
         last_started_with = data.get("last_started_with", None)
-        starting_with = [ p.get_full_name() for p in Workspace._get_dependencies(project_description, effective_project_descriptions) ]
+        starting_with = [ p.get_full_name() for p in dependency_graph.get_dependencies(project_description) ]
         if last_started_with is not None and starting_with != last_started_with:
             def q(l): return "[" + ", ".join(l) + "]"
             _logger.warning(f"Project {cyan(project_description)} is now being used with a different set of dependencies "
@@ -1372,13 +3293,13 @@ def check_project_dependencies(effective_project_descriptions, workspace, pause_
             if pause_after_warnings and sys.stdout.isatty() and sys.stdin.isatty():
                 input("Press Enter to continue, or Ctrl+C to abort ")
 
-def update_saved_project_dependencies(effective_project_descriptions, workspace):
-    for project_description in effective_project_descriptions:
-        starting_with = [ p.get_full_name() for p in Workspace._get_dependencies(project_description, effective_project_descriptions) ]
+def update_saved_project_dependencies(dependency_graph, workspace):
+    for project_description in dependency_graph.project_descriptions:
+        starting_with = [ p.get_full_name() for p in dependency_graph.get_dependencies(project_description) ]
         workspace.update_project_state(project_description, last_started_with=starting_with)
 
 def list_subcommand_main(project_name_patterns=None, list_mode="grouped", **kwargs):
-    global project_registry
+    project_registry = get_project_registry()
     projects = project_registry.get_all_project_descriptions()
     if project_name_patterns:
         tmp = []
@@ -1424,20 +3345,36 @@ def list_subcommand_main(project_name_patterns=None, list_mode="grouped", **kwar
             description = descriptions[0] if descriptions else "(no description)"
             print(f"{name.ljust(name_width)} {cyan(description)}")
     elif list_mode == "expand":
+        resolution_cache = ResolutionCache(os.path.join(ProjectRegistry.get_cache_directory(), "expansions.json"))
         for project in projects:
-            expanded = project_registry.expand_dependencies([project])
-            print(' '.join([p.get_full_name() for p in expanded]))
+            key = ResolutionCache.make_key("expand", [project])
+            expanded = resolution_cache.get(key)
+            if expanded is None:
+                expanded = [p.get_full_name() for p in project_registry.expand_dependencies([project])]
+                resolution_cache.put(key, expanded)
+            print(' '.join(expanded))
+        resolution_cache.save()
     elif list_mode == "expand-all":
+        resolution_cache = ResolutionCache(os.path.join(ProjectRegistry.get_cache_directory(), "expansions.json"))
         for project in projects:
-            combinations_list = project_registry.expand_dependencies([project], return_all=True)
-            for combination in combinations_list:
-                print(' '.join([p.get_full_name() for p in combination]))
+            key = ResolutionCache.make_key("expand-all", [project])
+            combinations_list = resolution_cache.get(key)
+            if combinations_list is not None:
+                for combination in combinations_list:
+                    print(' '.join(combination))
+            else:
+                combinations_list = []
+                for combination in project_registry.expand_dependencies([project], return_all=True):
+                    combinations_list.append([p.get_full_name() for p in combination])
+                    print(' '.join(combinations_list[-1]))
+                resolution_cache.put(key, combinations_list)
+        resolution_cache.save()
     else:
         raise Exception(f"invalid list mode '{list_mode}'")
 
 def info_subcommand_main(projects, raw=False, requested_options=None, **kwargs):
     # resolve project list
-    global project_registry
+    project_registry = get_project_registry()
     if not projects:
         project_descriptions = project_registry.get_all_project_descriptions()
     else:
@@ -1451,7 +3388,7 @@ def info_subcommand_main(projects, raw=False, requested_options=None, **kwargs):
                 raise Exception(project_registry.get_unknown_project_message(project))
 
     if raw:
-        serializable = [vars(p.activate_project_options(requested_options)) for p in project_descriptions]
+        serializable = [p.activate_project_options(requested_options).as_dict() for p in project_descriptions]
         print(json.dumps(serializable, indent=4))
         return
 
@@ -1492,29 +3429,32 @@ def info_subcommand_main(projects, raw=False, requested_options=None, **kwargs):
     print("Note: Specify `--raw` to `opp_env info` for more details.")
     print("Note: Options can be selected by adding `--options <optionname>` to the opp_env command line, see help. Options active by default are marked with '*'.")
 
-def init_subcommand_main(workspace_directory=None, force=False, nixless_workspace=False, **kwargs):
-    init_workspace(workspace_directory, force=force, nixless=nixless_workspace)
+def init_subcommand_main(workspace_directory=None, force=False, nixless_workspace=False, git_clone=None, **kwargs):
+    init_workspace(workspace_directory, force=force, nixless=nixless_workspace, git_clone=git_clone)
 
-def install_subcommand_main(projects, workspace_directory=None, install_without_build=False, requested_options=None, no_dependency_resolution=False, nixless_workspace=False, init=False, pause_after_warnings=True, **kwargs):
-    global project_registry
+def install_subcommand_main(projects, workspace_directory=None, install_without_build=False, requested_options=None, no_dependency_resolution=False, nixless_workspace=False, init=False, pause_after_warnings=True, from_bundle=None, **kwargs):
+    project_registry = get_project_registry()
+    bundle = SourceBundle(from_bundle) if from_bundle else None
 
     workspace = resolve_workspace(workspace_directory, init, nixless_workspace)
 
     specified_project_descriptions = resolve_projects(projects)
     if no_dependency_resolution:
-        effective_project_descriptions = sort_by_project_dependencies(activate_project_options(specified_project_descriptions, requested_options))
+        dependency_graph = ProjectDependencyGraph(activate_project_options(specified_project_descriptions, requested_options))
     else:
-        effective_project_descriptions = sort_by_project_dependencies(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options))
+        resolution_cache = workspace.get_resolution_cache()
+        dependency_graph = ProjectDependencyGraph(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options, resolution_cache))
+        resolution_cache.save()
+    effective_project_descriptions = dependency_graph.project_descriptions
     _logger.info(f"Using specified projects {cyan(str(specified_project_descriptions))} with effective projects {cyan(str(effective_project_descriptions))} in workspace {cyan(workspace.root_directory)}")
 
-    check_project_dependencies(effective_project_descriptions, workspace, pause_after_warnings)
+    check_project_dependencies(dependency_graph, workspace, pause_after_warnings)
 
     workspace.show_warnings_before_download(effective_project_descriptions, pause_after_warnings)
 
-    for project_description in effective_project_descriptions:
-        workspace.download_project_if_needed(project_description, effective_project_descriptions, **kwargs)
+    workspace.download_projects_if_needed(effective_project_descriptions, bundle=bundle, **kwargs)
 
-    update_saved_project_dependencies(effective_project_descriptions, workspace)
+    update_saved_project_dependencies(dependency_graph, workspace)
 
     if not install_without_build:
         workspace.nix_develop(effective_project_descriptions, commands=["build_all"])
@@ -1537,16 +3477,19 @@ def check_multiple_versions(project_descriptions):
             raise Exception(f"Multiple versions specified for project {cyan(name)}: {cyan(q(versions))} -- only one version of a project may be active at a time")
 
 def shell_subcommand_main(projects, workspace_directory=[], chdir=False, requested_options=None, no_dependency_resolution=False, init=False, install=False, install_without_build=False, build=False, nixless_workspace=False, isolated=True, pause_after_warnings=True, **kwargs):
-    global project_registry
+    project_registry = get_project_registry()
 
     workspace = resolve_workspace(workspace_directory, init, nixless_workspace)
 
     specified_project_descriptions = resolve_projects(projects) if projects else workspace.get_installed_projects()
     check_multiple_versions(specified_project_descriptions)
     if no_dependency_resolution:
-        effective_project_descriptions = sort_by_project_dependencies(activate_project_options(specified_project_descriptions, requested_options))
+        dependency_graph = ProjectDependencyGraph(activate_project_options(specified_project_descriptions, requested_options))
     else:
-        effective_project_descriptions = sort_by_project_dependencies(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options))
+        resolution_cache = workspace.get_resolution_cache()
+        dependency_graph = ProjectDependencyGraph(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options, resolution_cache))
+        resolution_cache.save()
+    effective_project_descriptions = dependency_graph.project_descriptions
     _logger.info(f"Using specified projects {cyan(str(specified_project_descriptions))} with effective projects {cyan(str(effective_project_descriptions))} in workspace {cyan(workspace.root_directory)}")
 
     if not install:
@@ -1554,15 +3497,14 @@ def shell_subcommand_main(projects, workspace_directory=[], chdir=False, request
             if workspace.get_project_status(project_description) != Workspace.DOWNLOADED:
                 raise Exception(f"Project {cyan(project_description.get_full_name())} is not downloaded, please run {cyan('opp_env install')} first, or use {cyan('opp_env shell --install')}")
 
-    check_project_dependencies(effective_project_descriptions, workspace, pause_after_warnings)
+    check_project_dependencies(dependency_graph, workspace, pause_after_warnings)
 
     workspace.show_warnings_before_download(effective_project_descriptions, pause_after_warnings)
 
     if install:
-        for project_description in effective_project_descriptions:
-            workspace.download_project_if_needed(project_description, effective_project_descriptions, **kwargs)
+        workspace.download_projects_if_needed(effective_project_descriptions, **kwargs)
 
-    update_saved_project_dependencies(effective_project_descriptions, workspace)
+    update_saved_project_dependencies(dependency_graph, workspace)
 
     hint_command = f"echo -e '{SHELL_GREEN}HINT{SHELL_NOCOLOR} To build, clean, test or check a project, use the `build_*`, `clean_*`, `test_*`, `smoke_test_*` and `check_*` commands.'"
     commands = ["build_all", hint_command] if build or (install and not install_without_build) else [hint_command]
@@ -1584,16 +3526,19 @@ def shell_subcommand_main(projects, workspace_directory=[], chdir=False, request
     workspace.nix_develop(effective_project_descriptions, commands=commands, interactive=True, isolated=isolated, check_exitcode=False, **kwargs)
 
 def run_subcommand_main(projects, command=None, workspace_directory=None, requested_options=None, no_dependency_resolution=False, init=False, install=False, install_without_build=False, build=False, nixless_workspace=False,  isolated=True, pause_after_warnings=True, run_test=False, run_smoke_test=False, **kwargs):
-    global project_registry
+    project_registry = get_project_registry()
 
     workspace = resolve_workspace(workspace_directory, init, nixless_workspace)
 
     specified_project_descriptions = resolve_projects(projects) if projects else workspace.get_installed_projects()
     check_multiple_versions(specified_project_descriptions)
     if no_dependency_resolution:
-        effective_project_descriptions = sort_by_project_dependencies(activate_project_options(specified_project_descriptions, requested_options))
+        dependency_graph = ProjectDependencyGraph(activate_project_options(specified_project_descriptions, requested_options))
     else:
-        effective_project_descriptions = sort_by_project_dependencies(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options))
+        resolution_cache = workspace.get_resolution_cache()
+        dependency_graph = ProjectDependencyGraph(project_registry.compute_effective_project_descriptions(specified_project_descriptions, requested_options, resolution_cache))
+        resolution_cache.save()
+    effective_project_descriptions = dependency_graph.project_descriptions
     _logger.info(f"Using specified projects {cyan(str(specified_project_descriptions))} with effective projects {cyan(str(effective_project_descriptions))} in workspace {cyan(workspace.root_directory)}")
 
     if not install:
@@ -1601,15 +3546,14 @@ def run_subcommand_main(projects, command=None, workspace_directory=None, reques
             if workspace.get_project_status(project_description) != Workspace.DOWNLOADED:
                 raise Exception(f"Project {cyan(project_description.get_full_name())} is not downloaded, please run {cyan('opp_env install')} first, or use {cyan('opp_env run --install')}")
 
-    check_project_dependencies(effective_project_descriptions, workspace, pause_after_warnings)
+    check_project_dependencies(dependency_graph, workspace, pause_after_warnings)
 
     workspace.show_warnings_before_download(effective_project_descriptions, pause_after_warnings)
 
     if install:
-        for project_description in effective_project_descriptions:
-            workspace.download_project_if_needed(project_description, effective_project_descriptions, **kwargs)
+        workspace.download_projects_if_needed(effective_project_descriptions, **kwargs)
 
-    update_saved_project_dependencies(effective_project_descriptions, workspace)
+    update_saved_project_dependencies(dependency_graph, workspace)
 
     if run_test:
         command = "test_all"
@@ -1623,13 +3567,172 @@ def run_subcommand_main(projects, command=None, workspace_directory=None, reques
     _logger.info(f"Running {'test ' if run_test else 'smoke_test ' if run_smoke_test else ''}command for projects {cyan(str(effective_project_descriptions))} in workspace {cyan(workspace.root_directory)} in {cyan(kind)} mode")
     workspace.nix_develop(effective_project_descriptions, workspace_directory, commands=commands, **dict(kwargs, suppress_stdout=False))
 
-def maint_subcommand_main(catalog_dir, **kwargs):
-    update_catalog(catalog_dir)
+def maint_subcommand_main(catalog_dir=None, rebuild_cache=False, clear_cache=False, update_download_hashes=False, prefetch=None, jobs=Workspace.MAX_PARALLEL_DOWNLOADS, downloads_dir=None, **kwargs):
+    if not catalog_dir and not rebuild_cache and not clear_cache and not update_download_hashes and prefetch is None:
+        raise Exception("No maintenance action specified, see 'opp_env maint -h'")
+    if clear_cache:
+        _logger.info(f"Deleting cached project database from {cyan(get_cache_directory())}")
+        ProjectRegistry.clear_cache()
+    if rebuild_cache:
+        _logger.info(f"Rebuilding cached project database in {cyan(get_cache_directory())}")
+        global _project_registry
+        _project_registry = ProjectRegistry(use_cache=False)
+        shutil.rmtree(ProjectRegistry.get_cache_directory(), ignore_errors=True)  # save_cache() does not replace an existing cache
+        _project_registry.save_cache()
+    if catalog_dir:
+        update_catalog(catalog_dir)
+    if update_download_hashes:
+        update_download_hashes_file()
+    if prefetch is not None:
+        prefetch_project_downloads(prefetch, jobs, downloads_dir)
+
+def update_download_hashes_file():
+    project_registry = get_project_registry()
+    download_urls = project_registry.get_all_download_urls()
+    download_hashes = ProjectRegistry.load_download_hashes() or {}
+    missing_urls = [url for url in download_urls if url not in download_hashes]
+    _logger.info(f"{len(download_urls)} download URLs in the project database, computing hashes for {len(missing_urls)} of them")
+
+    # the hash of a file is its name in the download cache
+    download_cache = DownloadCache()
+    def fetch(url):
+        try:
+            return os.path.basename(download_cache.fetch(url))
+        except Exception as e:
+            _logger.warning(f"{e}")
+            return None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=Workspace.MAX_PARALLEL_DOWNLOADS) as executor:
+        download_hashes.update({url: sha256 for url, sha256 in zip(missing_urls, executor.map(fetch, missing_urls)) if sha256})
+
+    # drop hashes of URLs no longer in the database
+    download_hashes = {url: download_hashes[url] for url in sorted(download_hashes) if url in download_urls}
+    file_name = ProjectRegistry.get_download_hashes_file_name()
+    with open(file_name, "w") as f:
+        f.write(json.dumps(download_hashes, indent=4) + "\n")
+    num_failed = len([url for url in missing_urls if url not in download_hashes])
+    _logger.info(f"Updated {cyan(file_name)}" + (f", {num_failed} download(s) failed" if num_failed else ""))
+
+def collect_project_downloads(project_descriptions):
+    # returns the files and the git repositories used by the projects with any of their options, as
+    # { url: {"kind": "download_url" or "patch", "projects": [project names], "sha256": expected hash or None} }
+    # and { git_url: {"projects": [project names]} }
+    downloads, git_repositories = {}, {}
+    for p in project_descriptions:
+        for fields in [p.as_dict(), *p.options.values()]:
+            urls = [("download_url", fields.get("download_url"), fields.get("download_sha256")), ("patch", fields.get("patch_url"), None),
+                    *[("patch", url, None) for url in (fields.get("patch_downloads") or {}).values()]]
+            for kind, url, sha256 in urls:
+                if url:
+                    entry = downloads.setdefault(url, {"kind": kind, "projects": [], "sha256": sha256})
+                    entry["projects"] = uniq(entry["projects"] + [p.name])
+            if fields.get("git_url"):
+                entry = git_repositories.setdefault(fields["git_url"], {"projects": []})
+                entry["projects"] = uniq(entry["projects"] + [p.name])
+    return downloads, git_repositories
+
+def run_host_command(command):
+    # runs a shell command outside any Nix environment, for maintenance operations that do not need a workspace; output goes to stderr
+    _logger.debug(f"Running command: {command}")
+    subprocess.run(["bash", "-c", f"set -eo pipefail; {command}"], stdout=sys.stderr, check=True)
+
+def select_projects_to_fetch(project_full_names):
+    # the given projects and their dependencies, or the whole database
+    project_registry = get_project_registry()
+    if not project_full_names:
+        return project_registry.get_all_project_descriptions()
+    project_descriptions = project_registry.expand_dependencies(resolve_projects(project_full_names))
+    if not project_descriptions:
+        raise Exception("The specified set of project versions cannot be satisfied")
+    return project_descriptions
+
+def fetch_project_downloads(project_descriptions, max_workers=Workspace.MAX_PARALLEL_DOWNLOADS, downloads_dir=None):
+    # Fills the download cache and the git mirrors for the given projects, and optionally also populates a
+    # $DOWNLOADS_DIR for local mode. Returns a summary of the results for each file and git repository.
+    downloads, git_repositories = collect_project_downloads(project_descriptions)
+    _logger.info(f"Fetching {len(downloads)} file(s) and {len(git_repositories)} git repositories for {len(project_descriptions)} project version(s), with up to {max_workers} concurrent downloads")
+    if downloads_dir:
+        os.makedirs(downloads_dir, exist_ok=True)
+
+    download_cache = DownloadCache()
+    git_mirror_cache = GitMirrorCache()
+
+    def fetch_file(url):
+        result = {"url": url, "kind": downloads[url]["kind"], "projects": downloads[url]["projects"]}
+        try:
+            fname = download_cache.fetch(url, sha256=downloads[url]["sha256"])
+            result.update(status="ok", sha256=os.path.basename(fname), file=fname)
+            if downloads_dir and result["kind"] == "download_url":
+                # every project that uses the file may look for it under a different name
+                for project_name in result["projects"]:
+                    local_file_name = os.path.join(downloads_dir, Workspace.get_local_download_file_name(project_name, url))
+                    if not os.path.isfile(local_file_name):
+                        shutil.copyfile(fname, local_file_name + ".tmp")
+                        os.replace(local_file_name + ".tmp", local_file_name)
+                    result.setdefault("local_files", []).append(local_file_name)
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        return result
+
+    def fetch_git_repository(git_url):
+        result = {"url": git_url, "projects": git_repositories[git_url]["projects"]}
+        try:
+            mirror_dir = git_mirror_cache.update(git_url, run_host_command)
+            result.update(status="ok", mirror=mirror_dir)
+            if downloads_dir:
+                # a bare clone that can be used as $<PROJECT>_REPO in local mode
+                local_repo_dir = os.path.join(downloads_dir, os.path.basename(mirror_dir))
+                if os.path.isdir(local_repo_dir):
+                    run_host_command(f"git -C '{local_repo_dir}' fetch --prune --tags '{mirror_dir}' '+refs/heads/*:refs/heads/*'")
+                else:
+                    run_host_command(f"git clone --bare '{mirror_dir}' '{local_repo_dir}' && git -C '{local_repo_dir}' remote set-url origin '{git_url}'")
+                result["local_repo"] = local_repo_dir
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        return result
+
+    # the (small number of) git repositories are started first, as they typically take the longest
+    with contextlib.redirect_stdout(sys.stderr):  # keep stdout clean for machine-readable output
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            git_futures = [executor.submit(fetch_git_repository, url) for url in git_repositories]
+            download_futures = [executor.submit(fetch_file, url) for url in downloads]
+            summary = {
+                "downloads": [f.result() for f in download_futures],
+                "git_repositories": [f.result() for f in git_futures],
+            }
+    results = summary["downloads"] + summary["git_repositories"]
+    summary["succeeded"] = len([r for r in results if r["status"] == "ok"])
+    summary["failed"] = len(results) - summary["succeeded"]
+    return summary
+
+def prefetch_project_downloads(project_full_names, max_workers=Workspace.MAX_PARALLEL_DOWNLOADS, downloads_dir=None):
+    # e.g. to prepare machines without network access; progress goes to stderr, and a JSON summary to stdout
+    summary = fetch_project_downloads(select_projects_to_fetch(project_full_names), max_workers, downloads_dir)
+    print(json.dumps(summary, indent=4))
+    if summary["failed"]:
+        raise Exception(f"Prefetching failed for {summary['failed']} of {summary['succeeded'] + summary['failed']} item(s), see the summary for details")
+
+def bundle_subcommand_main(action, projects, bundle_file_name, jobs=Workspace.MAX_PARALLEL_DOWNLOADS, **kwargs):
+    if action == "create":
+        create_bundle(projects, bundle_file_name, jobs)
+
+def create_bundle(project_full_names, bundle_file_name, max_workers=Workspace.MAX_PARALLEL_DOWNLOADS):
+    project_descriptions = select_projects_to_fetch(project_full_names)
+    # download_commands may fetch anything, which cannot be captured in a bundle
+    unsupported = [p for p in project_descriptions if p.download_commands]
+    if unsupported:
+        raise Exception(f"Cannot bundle the following project(s), because they are downloaded with custom commands (download_commands): {', '.join([str(p) for p in unsupported])}")
+    summary = fetch_project_downloads(project_descriptions, max_workers)
+    failed_results = [r for r in summary["downloads"] + summary["git_repositories"] if r["status"] != "ok"]
+    if failed_results:
+        raise Exception(f"Could not fetch {len(failed_results)} item(s):\n" + "\n".join([f"  {r['url']}: {r['error']}" for r in failed_results]))
+    _logger.info(f"Writing bundle {cyan(bundle_file_name)}")
+    SourceBundle.create(bundle_file_name, [p.get_full_name() for p in project_descriptions], summary["downloads"], summary["git_repositories"], run_host_command)
+    _logger.info(f"Created bundle {cyan(bundle_file_name)} of {len(project_descriptions)} project version(s), {len(summary['downloads'])} file(s) and {len(summary['git_repositories'])} git repositories ({os.path.getsize(bundle_file_name)/1024/1024:.1f} MiB)")
 
 def update_catalog(catalog_dir):
     # collect catalog URLs by project name
     _logger.info(f"Collecting catalog_url entries from projects")
-    global project_registry
+    project_registry = get_project_registry()
     project_catalog_urls = {}
     for project_description in project_registry.get_all_project_descriptions():
         catalog_url = project_description.metadata.get("catalog_url")
@@ -1683,6 +3786,8 @@ def main():
             shell_subcommand_main(**kwargs)
         elif subcommand == "run":
             run_subcommand_main(**kwargs)
+        elif subcommand == "bundle":
+            bundle_subcommand_main(**kwargs)
         elif subcommand == "maint":
             maint_subcommand_main(**kwargs)
         else:
@@ -1699,8 +3804,5 @@ def main():
         _logger.error(f"The {cyan(subcommand)} operation was interrupted by the user")
         return 130 # = 128 + SIGINT
 
-project_registry = ProjectRegistry()
-
-
 if __name__ == '__main__':
     sys.exit(main())
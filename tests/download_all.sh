@@ -1,3 +1,3 @@
-# extract non-empty download URLs from all project descriptions, and download the files (add the -P 4 option to xargs to use 4 threads)
-opp_env info --raw | jq '.[].download_url | select(. != null and . != "")' | sort | xargs -n 1 curl -LO
-
+# download the files and git repositories used by all project descriptions (including all their options) into the download cache,
+# and also into the current directory in the layout expected by --local mode ($DOWNLOADS_DIR); a JSON summary is written to download_all.json
+opp_env maint --prefetch --jobs 4 --downloads-dir . > download_all.json